@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# Триггеры дерева ставит и снимает команда tree_triggers (org/employers/tree_triggers.py),
+# а не миграция: иначе они зависели бы от DJANGO_TREE_TRIGGERS в момент migrate.
+# Откат миграции снимает триггеры, если они стоят.
+
+DROP_SQL = """
+DROP TRIGGER IF EXISTS employers_department_set_path_insert ON employers_department;
+DROP TRIGGER IF EXISTS employers_department_set_path_update ON employers_department;
+DROP TRIGGER IF EXISTS employers_department_move_subtree ON employers_department;
+DROP TRIGGER IF EXISTS employers_employee_set_structure_path_insert ON employers_employee;
+DROP TRIGGER IF EXISTS employers_employee_set_structure_path_update ON employers_employee;
+DROP FUNCTION IF EXISTS employers_department_set_path();
+DROP FUNCTION IF EXISTS employers_department_move_subtree();
+DROP FUNCTION IF EXISTS employers_employee_set_structure_path();
+"""
+
+
+def drop_triggers(apps, schema_editor):
+    schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0001_enable_ltree"),
+        ("employers", "0003_department_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, drop_triggers),
+    ]
@@ -0,0 +1,19 @@
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from org.utils.db_pool import maybe_log_pool_stats
+from org.utils.instrumentation import instrument_query
+
+
+@receiver(request_finished, dispatch_uid="log_db_pool_stats")
+def log_db_pool_stats(sender, **kwargs):
+    """Периодически пишет статистику пулов соединений в structlog"""
+    maybe_log_pool_stats()
+
+
+@receiver(connection_created, dispatch_uid="instrument_queries")
+def instrument_queries(sender, connection, **kwargs):
+    """Учет запросов в метриках запроса; с пулом сигнал приходит на каждое получение соединения"""
+    if instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_query)
@@ -1,14 +1,133 @@
-from django.contrib import admin
-from .models import Department, Employee
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Sum
+
+from .bulk import adjust_salary, top_level_departments, transfer_employees
+from .models import Department, DepartmentStats, Employee
+from .pagination import EstimatedCountPaginator
+from .tree_cache import get_tree_snapshot, get_versioned
+
+POSITIONS = "employees:positions"
+# Больше различных должностей - фильтр в боковой панели бесполезен, его не показываем
+MAX_POSITION_CHOICES = 100
+
+# Loose index scan по индексу position: по одному шагу индекса на каждое значение,
+# вместо SELECT DISTINCT по всей таблице сотрудников
+POSITIONS_SQL = """
+    WITH RECURSIVE positions AS (
+        (SELECT position FROM employers_employee ORDER BY position LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT e.position FROM employers_employee e
+            WHERE e.position > p.position
+            ORDER BY e.position LIMIT 1
+        )
+        FROM positions p
+        WHERE p.position IS NOT NULL
+    )
+    SELECT position FROM positions WHERE position IS NOT NULL LIMIT %s
+"""
+
+
+def build_positions(version: int) -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(POSITIONS_SQL, [MAX_POSITION_CHOICES + 1])
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SubtreeFilter(admin.SimpleListFilter):
+    """Отдел вместе с поддеревом: варианты из снимка дерева, фильтр - ltree <@ по path_field"""
+    title = 'Отдел (с поддеревом)'
+    parameter_name = 'subtree'
+    path_field = 'path'
+
+    def lookups(self, request, model_admin):
+        snapshot = get_tree_snapshot()
+        departments = sorted(
+            snapshot["nodes"].values(),
+            key=lambda dept: [int(label) for label in dept["path"].split(".")],
+        )
+        return [(dept["id"], f"{'— ' * (dept['level'] - 1)}{dept['name']}") for dept in departments]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        try:
+            dept = get_tree_snapshot()["nodes"].get(int(self.value()))
+        except ValueError:
+            dept = None
+        if dept is None:
+            return queryset.none()
+        # Имя таблицы явно: в changelist есть JOIN'ы (parent, stats) со своими path
+        column = f"{queryset.model._meta.db_table}.{self.path_field}"
+        return queryset.extra(where=[f"{column} <@ %s::ltree"], params=[dept["path"]])
+
+
+class EmployeeSubtreeFilter(SubtreeFilter):
+    path_field = 'structure_path'
+
+
+class PositionFilter(admin.SimpleListFilter):
+    """Должности без DISTINCT по таблице (AllValuesFieldListFilter): loose index scan, кеш на версию дерева"""
+    title = 'Должность'
+    parameter_name = 'position'
+
+    def lookups(self, request, model_admin):
+        positions = get_versioned(POSITIONS, build_positions)
+        if len(positions) > MAX_POSITION_CHOICES:
+            return []
+        return [(position, position) for position in positions]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(position=self.value())
+
+
+class EmployeePaginator(EstimatedCountPaginator):
+    def unfiltered_count(self):
+        """Точный итог без COUNT(*): сумма численности поддеревьев корневых отделов"""
+        return DepartmentStats.objects.filter(department__parent__isnull=True).aggregate(
+            total=Sum('subtree_count')
+        )['total'] or 0
+
+
+class SalaryActionForm(ActionForm):
+    percent = forms.DecimalField(
+        label='Изменение зарплаты, %', required=False, max_digits=6, decimal_places=2, min_value=-99.99
+    )
+
+
+class TransferActionForm(ActionForm):
+    department = forms.ModelChoiceField(
+        Department.objects.only('id', 'name').order_by('path'), label='В отдел', required=False
+    )
+
+
+def action_value(model_admin, request, name):
+    """Значение поля action_form для действия; None - не заполнено или некорректно"""
+    try:
+        return model_admin.action_form.base_fields[name].clean(request.POST.get(name))
+    except ValidationError:
+        return None
 
 
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
-    list_display = ['name', 'parent', 'level', 'path', 'employees_count']
-    list_filter = ['level', 'parent']
+    list_display = ['name', 'parent', 'level', 'path', 'employees_count', 'subtree_count']
+    list_filter = ['level', SubtreeFilter]
     search_fields = ['name', 'path']
     readonly_fields = ['level', 'path']
     ordering = ['path']
+    list_select_related = ['parent', 'stats']
+    autocomplete_fields = ['parent']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = SalaryActionForm
+    actions = ['adjust_subtree_salary']
 
     fieldsets = (
         ('Основная информация', {
@@ -21,19 +140,55 @@ class DepartmentAdmin(admin.ModelAdmin):
     )
 
     def employees_count(self, obj):
-        """Количество сотрудников в отделе"""
-        return obj.employees.count()
+        """Количество сотрудников в отделе (из DepartmentStats, без COUNT на строку)"""
+        stats = getattr(obj, 'stats', None)
+        return stats.direct_count if stats else 0
 
     employees_count.short_description = 'Сотрудников'
+    employees_count.admin_order_field = 'stats__direct_count'
+
+    def subtree_count(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.subtree_count if stats else 0
+
+    subtree_count.short_description = 'С поддеревом'
+    subtree_count.admin_order_field = 'stats__subtree_count'
+
+    @admin.action(description='Изменить зарплаты поддерева на указанный %%')
+    def adjust_subtree_salary(self, request, queryset):
+        """Один UPDATE на порцию сотрудников (bulk.adjust_salary); вложенные отделы не считаются дважды"""
+        percent = action_value(self, request, 'percent')
+        if not percent:
+            self.message_user(request, 'Укажите изменение зарплаты в процентах', messages.ERROR)
+            return
+        departments = top_level_departments(queryset.select_related(None).only('id', 'path'))
+        try:
+            updated = sum(adjust_salary(dept, percent) for dept in departments)
+        except ValueError as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+            return
+        self.message_user(request, f'Зарплата изменена на {percent}% у сотрудников: {updated}')
 
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
+    """
+    Рассчитана на миллионы сотрудников: без точных COUNT(*) (EmployeePaginator,
+    show_full_result_count), без DISTINCT-сканов в фильтрах и date_hierarchy,
+    поиск - только по полям с триграммными индексами.
+    """
     list_display = ['full_name', 'position', 'department', 'hired_at', 'salary']
-    list_filter = ['department', 'hired_at', 'position']
-    search_fields = ['full_name', 'position', 'department__name']
+    list_filter = [EmployeeSubtreeFilter, 'hired_at', PositionFilter]
+    search_fields = ['full_name', 'position']
     readonly_fields = ['structure_path']
-    date_hierarchy = 'hired_at'
+    list_select_related = ['department']
+    autocomplete_fields = ['department']
+    # С id в конце Django не добавляет свой -pk, и порядок совпадает с индексом (full_name, id)
+    ordering = ['full_name', 'id']
+    paginator = EmployeePaginator
+    show_full_result_count = False
+    action_form = TransferActionForm
+    actions = ['transfer_selected']
 
     fieldsets = (
         ('Основная информация', {
@@ -47,3 +202,13 @@ class EmployeeAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+    @admin.action(description='Перевести в указанный отдел')
+    def transfer_selected(self, request, queryset):
+        """Один UPDATE на порцию сотрудников вместо save() на каждого (bulk.transfer_employees)"""
+        department = action_value(self, request, 'department')
+        if department is None:
+            self.message_user(request, 'Выберите отдел для перевода', messages.ERROR)
+            return
+        moved = transfer_employees(queryset, department)
+        self.message_user(request, f'Переведено в "{department}" сотрудников: {moved}')
@@ -0,0 +1,82 @@
+"""
+Сводная аналитика по зарплатам для каждого поддерева отделов.
+
+Считается одним запросом сразу для всех отделов: каждая строка сотрудника размножается
+на префиксы своего structure_path (по одному на каждого предка, <= MAX_LEVEL) и
+группируется по префиксу и по (префиксу, должности) через GROUPING SETS.
+Результат кешируется на версию дерева (tree_cache.get_versioned): любое изменение
+сотрудника или отдела поднимает версию, дашборды читают готовые свертки.
+"""
+from __future__ import annotations
+
+from org.utils.db_router import read_connection
+
+from .tree_cache import get_versioned
+
+ANALYTICS = "department_tree:analytics"
+PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+
+ROLLUP_SQL = """
+    SELECT d.id AS department_id,
+           x.position,
+           GROUPING(x.position) = 1 AS is_total,
+           count(*) AS headcount,
+           sum(x.salary) AS salary_sum,
+           round(avg(x.salary), 2) AS salary_avg,
+           min(x.salary) AS salary_min,
+           max(x.salary) AS salary_max,
+           (percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY x.salary))::numeric(12, 2)[] AS percentiles
+    FROM (
+        SELECT subpath(e.structure_path, 0, lvl) AS prefix, e.position, e.salary
+        FROM employers_employee e
+        CROSS JOIN LATERAL generate_series(1, nlevel(e.structure_path)) AS lvl
+    ) x
+    JOIN employers_department d ON d.path = x.prefix
+    GROUP BY GROUPING SETS ((d.id), (d.id, x.position))
+"""
+
+
+def _salary_stats(row) -> dict:
+    stats = {
+        "sum": row["salary_sum"],
+        "avg": row["salary_avg"],
+        "min": row["salary_min"],
+        "max": row["salary_max"],
+    }
+    for percentile, value in zip(PERCENTILES, row["percentiles"]):
+        stats[f"p{round(percentile * 100)}"] = value
+    return stats
+
+
+def build_rollups(version: int) -> dict:
+    """{department_id: {"headcount", "salary", "positions"}} для всех непустых поддеревьев"""
+    with read_connection().cursor() as cursor:
+        cursor.execute(ROLLUP_SQL, [list(PERCENTILES)])
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    rollups = {}
+    for row in rows:
+        rollup = rollups.setdefault(row["department_id"], {"headcount": 0, "salary": None, "positions": []})
+        if row["is_total"]:
+            rollup["headcount"] = row["headcount"]
+            rollup["salary"] = _salary_stats(row)
+        else:
+            rollup["positions"].append({
+                "position": row["position"],
+                "headcount": row["headcount"],
+                "salary": _salary_stats(row),
+            })
+
+    for rollup in rollups.values():
+        rollup["positions"].sort(key=lambda item: (-item["headcount"], item["position"]))
+    return rollups
+
+
+def get_rollups() -> dict:
+    return get_versioned(ANALYTICS, build_rollups)
+
+
+def get_department_analytics(department_id: int) -> dict:
+    """Свертка поддерева отдела; у отдела без сотрудников - нулевая численность"""
+    return get_rollups().get(department_id, {"headcount": 0, "salary": None, "positions": []})
@@ -7,3 +7,4 @@ class EmployersConfig(AppConfig):
 
     def ready(self):
         import org.employers.signals  # noqa
+        import org.employers.tree_triggers  # noqa  (проверка check_tree_triggers)
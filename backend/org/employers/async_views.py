@@ -0,0 +1,220 @@
+"""
+Async-варианты DepartmentLTreeView и DepartmentEmployeesView для ASGI (daphne).
+
+Запросы к БД идут через пул psycopg 3 (org/utils/async_db.py), кеш - через redis.asyncio
+(org/utils/async_cache.py): обработчик не занимает поток на время ввода-вывода.
+Подключаются в urls.py при DJANGO_ASYNC_VIEWS=true.
+"""
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from org.utils import async_cache
+from org.utils.async_db import fetch_all, fetch_one
+from org.utils.db_router import use_primary
+
+from .conditional import tree_conditional
+from .employee_pages import FIRST_CURSOR_PAGE, apage_versions, is_cacheable, page_key, page_number
+from .pagination import CountedPage, CountedPaginator, InvalidCursor, KeysetPage, decode_cursor
+from .replicas import read_from_replica
+from .subtree import BRANCH_PATHS_SQL, EMPLOYEE_FIELDS, can_merge, merge_query
+from .tree_cache import aget_root_departments
+from .tree_index import aget_tree_index
+
+DEPARTMENT_SQL = """
+    SELECT d.id, d.name, d.path::text AS path,
+           COALESCE(s.direct_count, 0) AS employees_count,
+           COALESCE(s.subtree_count, 0) AS subtree_count
+    FROM employers_department d
+    LEFT JOIN employers_departmentstats s ON s.department_id = d.id
+    WHERE d.id = %s
+"""
+EMPLOYEE_COLUMNS = "e.id, e.full_name, e.position, e.hired_at, e.salary, e.department_id"
+
+
+def is_ajax(request) -> bool:
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class AsyncDepartmentLTreeView(View):
+    """Дерево отделов: корневые отделы из снимка в Redis без блокирующих вызовов"""
+    template_name = 'employers/department_tree.html'
+
+    async def get(self, request, *args, **kwargs):
+        root_departments = await aget_root_departments()
+        return render(request, self.template_name, {'root_departments': root_departments})
+
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class AsyncDepartmentEmployeesView(View):
+    """Страница сотрудников отдела (номер страницы или курсор), ответ как у DepartmentEmployeesView"""
+    template_name = 'employers/employees_list.html'
+    MAX_PER_PAGE = 100
+
+    async def get(self, request, *args, **kwargs):
+        include_subtree = request.GET.get('include_subtree', 'false').lower() == 'true'
+        use_cursor = request.GET.get('pagination') == 'cursor'
+        try:
+            department_id = int(request.GET.get('department_id'))
+            per_page = max(min(int(request.GET.get('per_page', 10)), self.MAX_PER_PAGE), 1)
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+
+        # Отдел и ветки поддерева - из индекса дерева в памяти, в БД - если индекс устарел
+        index = await aget_tree_index()
+        if index is not None:
+            department = index.nodes.get(department_id)
+        else:
+            department = await fetch_one(DEPARTMENT_SQL, [department_id])
+        if department is None:
+            return JsonResponse({'error': 'Отдел не найден'}, status=404)
+
+        # Первые страницы - из общего с DepartmentEmployeesView кеша (employee_pages.py)
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        cache_key = None
+        if is_ajax(request) and not (after or before):
+            if use_cursor:
+                page = FIRST_CURSOR_PAGE
+            else:
+                page = page_number(department, include_subtree, request.GET.get('page', 1), per_page)
+            if is_cacheable(page):
+                versions = (await apage_versions([department_id]))[department_id]
+                cache_key = page_key(versions, department_id, include_subtree, page, per_page)
+                payload = await async_cache.aget(cache_key)
+                if payload is not None:
+                    return JsonResponse(payload)
+                # Страница ляжет в кеш надолго: строится по основной БД, а не по отстающей реплике,
+                # и с численностью из БД, а не из возможно отстающего снимка
+                with use_primary():
+                    department = await fetch_one(DEPARTMENT_SQL, [department_id]) or department
+                    return await self.respond(
+                        request, department, index, include_subtree, use_cursor, per_page, after, before, cache_key
+                    )
+
+        return await self.respond(request, department, index, include_subtree, use_cursor, per_page, after, before)
+
+    async def respond(self, request, department, index, include_subtree, use_cursor, per_page,
+                      after=None, before=None, cache_key=None):
+        """Страница отдела из БД; cache_key - куда положить AJAX-ответ"""
+        department_id = department['id']
+        if include_subtree:
+            where, total = "e.structure_path <@ %s::ltree", department['subtree_count']
+        else:
+            where, total = "e.structure_path = %s::ltree", department['employees_count']
+        params = [department['path']]
+        branch_paths = None
+        if include_subtree and index is not None:
+            branch_paths = index.branch_paths(department_id)
+        elif include_subtree:
+            branch_paths = [row['path'] for row in await fetch_all(BRANCH_PATHS_SQL, params)]
+
+        if use_cursor:
+            try:
+                page = await self.fetch_cursor_page(where, params, per_page, after, before, branch_paths)
+            except InvalidCursor:
+                return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+            context = {
+                'employees': page.employees,
+                'department': department,
+                'cursor_page': page,
+                'include_subtree': include_subtree,
+            }
+            if not is_ajax(request):
+                return render(request, self.template_name, context)
+            html = render_to_string(self.template_name, context, request=request)
+            return await self.page_response(cache_key, {
+                'html': html,
+                'has_previous': page.has_previous,
+                'has_next': page.has_next,
+                'next_cursor': page.next_cursor,
+                'prev_cursor': page.prev_cursor,
+                'total_count': total,
+            })
+
+        paginator = CountedPaginator((), per_page, count=total)
+        try:
+            number = paginator.validate_number(request.GET.get('page', 1))
+        except InvalidPage:
+            number = 1
+        offset = (number - 1) * per_page
+        if branch_paths is not None and can_merge(len(branch_paths), offset + per_page):
+            employees = await fetch_all(*merge_query(branch_paths, EMPLOYEE_FIELDS, per_page, offset=offset))
+        else:
+            employees = await fetch_all(
+                f"SELECT {EMPLOYEE_COLUMNS} FROM employers_employee e WHERE {where} "
+                f"ORDER BY e.full_name, e.id LIMIT %s OFFSET %s",
+                [*params, per_page, offset],
+            )
+        page_obj = CountedPage(employees, number, paginator)
+
+        context = {
+            'employees': page_obj,
+            'department': department,
+            'page_obj': page_obj,
+            'include_subtree': include_subtree,
+        }
+        if not is_ajax(request):
+            return render(request, self.template_name, context)
+        html = render_to_string(self.template_name, context, request=request)
+        return await self.page_response(cache_key, {
+            'html': html,
+            'has_previous': page_obj.has_previous(),
+            'has_next': page_obj.has_next(),
+            'current_page': page_obj.number,
+            'num_pages': paginator.num_pages,
+            'total_count': paginator.count,
+        })
+
+    async def page_response(self, cache_key, payload) -> JsonResponse:
+        if cache_key:
+            await async_cache.aset(cache_key, payload, settings.DEPARTMENT_TREE_CACHE_TTL)
+        return JsonResponse(payload)
+
+    async def fetch_cursor_page(self, where, params, per_page, after=None, before=None,
+                                branch_paths=None) -> KeysetPage:
+        """Seek-пагинация по (full_name, id), как keyset_paginate, но без ORM"""
+        sql = f"SELECT {EMPLOYEE_COLUMNS} FROM employers_employee e WHERE {where}"
+        merge = branch_paths is not None and can_merge(len(branch_paths), per_page + 1)
+
+        if before:
+            full_name, pk = decode_cursor(before)
+            if merge:
+                rows = await fetch_all(*merge_query(branch_paths, EMPLOYEE_FIELDS, per_page + 1,
+                                                    before=(full_name, pk)))
+            else:
+                rows = await fetch_all(
+                    f"{sql} AND (e.full_name, e.id) < (%s, %s) ORDER BY e.full_name DESC, e.id DESC LIMIT %s",
+                    [*params, full_name, pk, per_page + 1],
+                )
+            # Следующая страница есть, если существует строка курсора или строка после нее
+            if merge:
+                tail = await fetch_all(*merge_query(branch_paths, ["id", "full_name"], 1, after=(full_name, pk - 1)))
+            else:
+                tail = await fetch_all(f"{sql} AND (e.full_name, e.id) >= (%s, %s) LIMIT 1", [*params, full_name, pk])
+            return KeysetPage(
+                employees=list(reversed(rows[:per_page])),
+                has_next=bool(tail),
+                has_previous=len(rows) > per_page,
+            )
+
+        key = decode_cursor(after) if after else None
+        if merge:
+            rows = await fetch_all(*merge_query(branch_paths, EMPLOYEE_FIELDS, per_page + 1, after=key))
+        else:
+            if key:
+                sql += " AND (e.full_name, e.id) > (%s, %s)"
+                params = [*params, *key]
+            rows = await fetch_all(f"{sql} ORDER BY e.full_name, e.id LIMIT %s", [*params, per_page + 1])
+        return KeysetPage(
+            employees=rows[:per_page],
+            has_next=len(rows) > per_page,
+            has_previous=bool(after),
+        )
@@ -0,0 +1,168 @@
+"""
+Массовые операции над сотрудниками: перевод в другой отдел и изменение зарплат поддерева.
+
+Вместо Employee.save() на каждую строку - один UPDATE на порцию из EMPLOYEE_BULK_BATCH_SIZE
+сотрудников подряд по id (для поддерева - диапазон id такой длины, как в verify_tree). Каждая порция - своя короткая транзакция: блокировки строк
+держатся только на время одной порции (если вызывающий код не обернул все в atomic).
+Сигналы при этом не срабатывают, поэтому их работа делается здесь же: раз на порцию -
+численность (DepartmentStats и рассылка headcount) и версия дерева, раз на всю операцию -
+версии кешированных страниц затронутых отделов (employee_pages.bump_page_versions).
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+from functools import partial
+
+import structlog
+from django.conf import settings
+from django.db import connection, transaction
+
+from .employee_pages import bump_page_versions
+from .headcount import publish_headcount
+from .models import Department, DepartmentStats, Employee
+from .tree_cache import bump_tree_version
+
+# Старый отдел читается под FOR UPDATE, а structure_path - из отдела в том же UPDATE
+TRANSFER_SQL = """
+    WITH old AS (
+        SELECT id, department_id
+        FROM employers_employee
+        WHERE id = ANY(%s) AND department_id <> %s
+        FOR UPDATE
+    ),
+    moved AS (
+        UPDATE employers_employee e
+        SET department_id = d.id, structure_path = d.path
+        FROM old, employers_department d
+        WHERE e.id = old.id AND d.id = %s
+        RETURNING old.department_id
+    )
+    SELECT department_id, count(*) FROM moved GROUP BY department_id
+"""
+
+# Путь поддерева - из БД в каждом запросе, а не из индекса дерева: он только для чтения
+SUBTREE_PATH = "(SELECT path FROM employers_department WHERE id = %s)"
+
+SUBTREE_IDS_SQL = f"""
+    SELECT min(id), max(id), max(salary) FROM employers_employee WHERE structure_path <@ {SUBTREE_PATH}
+"""
+
+SALARY_SQL = f"""
+    UPDATE employers_employee
+    SET salary = round(salary * %s, 2)
+    WHERE structure_path <@ {SUBTREE_PATH} AND id >= %s AND id < %s
+"""
+
+LINEAGE_SQL = f"""
+    SELECT id FROM employers_department
+    WHERE path <@ {SUBTREE_PATH} OR path @> {SUBTREE_PATH}
+"""
+
+
+logger = structlog.get_logger(__name__)
+
+# Наибольшее значение колонки salary: numeric(max_digits, decimal_places)
+_salary = Employee._meta.get_field("salary")
+MAX_SALARY = Decimal(10) ** (_salary.max_digits - _salary.decimal_places) - Decimal(10) ** -_salary.decimal_places
+
+
+def _after_batch(deltas: dict | None = None) -> None:
+    """То, что делают сигналы Employee, но раз на порцию (в ее транзакции, до коммита)"""
+    if deltas:
+        publish_headcount(deltas)
+    transaction.on_commit(bump_tree_version)
+
+
+def transfer_employees(queryset, to_department: Department, batch_size: int | None = None) -> int:
+    """
+    Переводит сотрудников queryset в to_department. Возвращает число переведенных
+    (уже состоявшие в to_department не считаются).
+    """
+    batch_size = batch_size or settings.EMPLOYEE_BULK_BATCH_SIZE
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    moved_total = 0
+    last_id = 0
+    # Отделы с измененной численностью и их предки (ключи изменений apply_changes)
+    changed = set()
+    try:
+        while True:
+            batch = list(ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return moved_total
+            last_id = batch[-1]
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(TRANSFER_SQL, [batch, to_department.pk, to_department.pk])
+                moved = dict(cursor.fetchall())
+                if moved:
+                    changes = {dept_id: -count for dept_id, count in moved.items()}
+                    changes[to_department.pk] = sum(moved.values())
+                    deltas = DepartmentStats.objects.apply_changes(changes)
+                    changed.update(deltas)
+                    _after_batch(deltas)
+            moved_total += sum(moved.values())
+    finally:
+        transaction.on_commit(partial(bump_page_versions, changed))
+
+
+def adjust_salary(subtree: Department, pct, batch_size: int | None = None, start_id: int = 0) -> int:
+    """
+    Меняет зарплату всех сотрудников поддерева subtree на pct процентов (10 - +10%,
+    -5 - -5%), с округлением до копеек. Возвращает число измененных сотрудников.
+
+    Порции коммитятся по отдельности. Переполнение зарплаты проверяется до первой порции
+    (ValueError), а при ошибке посреди операции событие bulk_salary_failed пишет resume_from:
+    повторный вызов с start_id=resume_from продолжит с первой незакоммиченной порции.
+    """
+    pct = Decimal(pct)
+    if pct <= -100:
+        raise ValueError("Зарплату нельзя уменьшить на 100% и больше")
+    batch_size = batch_size or settings.EMPLOYEE_BULK_BATCH_SIZE
+    factor = 1 + pct / 100
+
+    with connection.cursor() as cursor:
+        cursor.execute(LINEAGE_SQL, [subtree.pk, subtree.pk])
+        lineage = [row[0] for row in cursor.fetchall()]
+        # Порции - диапазоны id: каждая читает только свои строки, а не остаток поддерева
+        cursor.execute(SUBTREE_IDS_SQL, [subtree.pk])
+        min_id, max_id, max_salary = cursor.fetchone()
+    if min_id is None:
+        return 0
+    if round(max_salary * factor, 2) > MAX_SALARY:
+        raise ValueError(f"Зарплата {max_salary} после изменения на {pct}% превысит {MAX_SALARY}")
+
+    updated = 0
+    low = max(min_id, start_id)
+    try:
+        while low <= max_id:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(SALARY_SQL, [factor, subtree.pk, low, low + batch_size])
+                if cursor.rowcount:
+                    updated += cursor.rowcount
+                    _after_batch()
+            low += batch_size
+        return updated
+    except Exception:
+        logger.error(
+            "bulk_salary_failed", department_id=subtree.pk, pct=str(pct), updated=updated, resume_from=low,
+        )
+        raise
+    finally:
+        # Зарплаты видны на страницах всего поддерева и его предков
+        transaction.on_commit(partial(bump_page_versions, lineage))
+
+
+def top_level_departments(departments) -> list[Department]:
+    """Отделы без предков среди переданных: поддерево не должно обрабатываться дважды"""
+    paths = {dept.pk: '.'.join(dept.path) for dept in departments}
+    selected = set(paths.values())
+    return [
+        dept for dept in departments
+        if not any(ancestor in selected for ancestor in _ancestor_paths(paths[dept.pk]))
+    ]
+
+
+def _ancestor_paths(path: str):
+    labels = path.split('.')
+    return ('.'.join(labels[:length]) for length in range(1, len(labels)))
+
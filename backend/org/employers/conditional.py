@@ -0,0 +1,70 @@
+"""
+Условные GET для страниц и API, которые зависят только от отделов и сотрудников.
+
+Валидаторы - версия дерева и время ее изменения (tree_cache.get_tree_validators): их
+поднимает любое изменение отдела или сотрудника. Повторный запрос неизменившихся данных
+стоит одного чтения из кеша и ответа 304 - без запросов к БД, рендера и передачи тела.
+Cache-Control (public, HTTP_CACHE_MAX_AGE, must-revalidate) позволяет nginx и браузеру
+хранить ответ и перепроверять его по ETag.
+"""
+from __future__ import annotations
+
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .tree_cache import aget_tree_validators, get_tree_validators
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def tree_etag(request, version: int, modified: int) -> str:
+    # Один URL отдает HTML и JSON для AJAX - это разные представления
+    kind = "xhr" if request.headers.get("X-Requested-With") == "XMLHttpRequest" else "page"
+    return f'W/"{version}.{modified}-{kind}"'
+
+
+def _not_modified(request, version, modified):
+    return get_conditional_response(request, etag=tree_etag(request, version, modified), last_modified=modified)
+
+
+def _add_validators(request, response, version, modified):
+    if getattr(request, "replica_may_lag", False):
+        # Ответ с реплики, которая может еще не видеть версию version: не кешировать под ее ETag
+        patch_cache_control(response, no_cache=True)
+    elif response.status_code in (200, 304):
+        response.headers.setdefault("ETag", tree_etag(request, version, modified))
+        response.headers.setdefault("Last-Modified", http_date(modified))
+        patch_cache_control(response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE, must_revalidate=True)
+    patch_vary_headers(response, ["X-Requested-With"])
+    return response
+
+
+def tree_conditional(view):
+    """ETag / Last-Modified по версии дерева и 304 без вызова view (для sync и async view)"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_inner(request, *args, **kwargs):
+            if request.method not in SAFE_METHODS:
+                return await view(request, *args, **kwargs)
+            version, modified = await aget_tree_validators()
+            request.tree_validators = (version, modified)
+            response = _not_modified(request, version, modified) or await view(request, *args, **kwargs)
+            return _add_validators(request, response, version, modified)
+
+        return async_inner
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+        version, modified = get_tree_validators()
+        # Повторно используется в replicas.read_from_replica
+        request.tree_validators = (version, modified)
+        response = _not_modified(request, version, modified) or view(request, *args, **kwargs)
+        return _add_validators(request, response, version, modified)
+
+    return inner
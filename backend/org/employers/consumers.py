@@ -0,0 +1,37 @@
+import asyncio
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+
+from .headcount import HEADCOUNT_GROUP, merge_deltas
+
+
+class HeadcountConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Живая численность отделов: изменения из группы channel layer копятся и склеиваются
+    по отделам, клиенту уходит одно сообщение раз в HEADCOUNT_PUSH_INTERVAL_MS.
+    Формат: {"type": "headcount", "deltas": {"<department_id>": [direct_delta, subtree_delta]}}
+    """
+    groups = [HEADCOUNT_GROUP]
+
+    async def connect(self):
+        self.pending = {}
+        self.flush_task = None
+        await self.accept()
+
+    async def disconnect(self, code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+
+    async def headcount_delta(self, event):
+        merge_deltas(self.pending, event["deltas"])
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.HEADCOUNT_PUSH_INTERVAL_MS / 1000)
+        pending, self.pending = self.pending, {}
+        self.flush_task = None
+        deltas = {key: list(value) for key, value in pending.items() if tuple(value) != (0, 0)}
+        if deltas:
+            await self.send_json({"type": "headcount", "deltas": deltas})
@@ -0,0 +1,465 @@
+"""
+Страницы сотрудников отдела - ответ DepartmentEmployeesView на AJAX-запрос.
+
+Готовый ответ (HTML + данные пагинации) кешируется под ключом (версия структуры, отдел,
+версия страниц отдела, include_subtree, страница, per_page). Версия страниц отдела растет после
+коммита изменения сотрудников самого отдела или его поддерева (invalidate_pages), версия
+структуры - после изменения любого отдела; старые страницы просто перестают читаться, а
+страницы остальных отделов остаются в кеше. Кешируются первые EMPLOYEE_PAGE_CACHE_PAGES
+страниц и первая страница курсорной пагинации - ее запрашивает дерево при раскрытии отдела.
+Страница для кеша всегда строится по основной БД (use_primary): данные отстающей реплики
+иначе остались бы в кеше до следующего изменения отдела.
+
+warm_pages() строит первые страницы заранее командой warm_employee_cache, не в процессе
+веб-сервера. С EMPLOYEE_PAGE_WARM_ON_CHANGE изменения пишутся в журнал (read_changes), и
+`warm_employee_cache --watch` догревает только отделы с измененной численностью и их предков.
+batch_payloads() отдает страницы нескольких отделов разом: из кеша и одним запросом к БД.
+"""
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from dataclasses import dataclass, replace
+
+import structlog
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.template.loader import render_to_string
+
+from org.utils import async_cache
+from org.utils.db_router import use_primary
+
+from .models import DepartmentStats, Employee
+from .pagination import CountedPaginator, KeysetPage, decode_cursor, keyset_paginate
+from .subtree import (
+    EMPLOYEE_FIELDS,
+    can_merge,
+    can_window,
+    fetch_rows,
+    get_branch_paths,
+    get_branch_paths_many,
+    keyset_page,
+    merge_query,
+    window_query,
+)
+from .tree_cache import (
+    STRUCTURE_VERSION_KEY,
+    aget_structure_version,
+    build_snapshot,
+    get_structure_version,
+    get_tree_snapshot,
+    get_tree_version,
+)
+from .tree_index import get_department_path
+
+logger = structlog.get_logger(__name__)
+
+TEMPLATE = 'employers/employees_list.html'
+PAGES = "employees_page"
+# Первая страница курсорной пагинации (без after/before)
+FIRST_CURSOR_PAGE = "cursor"
+DEFAULT_PER_PAGE = 10
+# Версия страниц отдела (без срока жизни)
+PAGE_VERSION = f"{PAGES}:version"
+# Журнал измененных отделов: номер последней записи и записи по номерам
+CHANGES = f"{PAGES}:changes"
+CHANGES_SEQ = f"{CHANGES}:seq"
+CHANGES_TTL = 60 * 60
+# Больше записей журнала за раз - проще прогреть все отделы
+MAX_CHANGES_READ = 1000
+
+
+def department_employees(dept_path, include_subtree):
+    """Сотрудники отдела (или всего поддерева через GiST по structure_path), по full_name"""
+    if include_subtree:
+        return Employee.objects.extra(
+            where=["structure_path <@ %s::ltree"],
+            params=[dept_path]
+        ).order_by('full_name')
+    return Employee.objects.filter(structure_path=dept_path).order_by('full_name')
+
+
+def get_total_count(department, include_subtree):
+    """Итог для пагинатора из численности отдела (DepartmentStats в снимке дерева)"""
+    return department['subtree_count'] if include_subtree else department['employees_count']
+
+
+def page_number(department, include_subtree, page, per_page) -> int:
+    """Номер страницы по численности отдела, без запросов; некорректный или за концом - первая"""
+    paginator = CountedPaginator((), per_page, count=get_total_count(department, include_subtree))
+    try:
+        return paginator.validate_number(page)
+    except InvalidPage:
+        return 1
+
+
+def page_context(department, include_subtree, page, per_page) -> dict:
+    dept_path = department['path']
+    employees = department_employees(dept_path, include_subtree).select_related('department')
+    paginator = CountedPaginator(employees, per_page, count=get_total_count(department, include_subtree))
+    # Номер проверен по численности из индекса; свежая численность могла уменьшиться
+    page_obj = paginator.get_page(page)
+
+    # Поддерево читается слиянием отсортированных веток (см. subtree.py), если их не слишком много
+    offset = (page_obj.number - 1) * per_page
+    if include_subtree:
+        branch_paths = get_branch_paths(dept_path, department['id'])
+        if can_merge(len(branch_paths), offset + per_page):
+            page_obj.object_list = fetch_rows(*merge_query(branch_paths, EMPLOYEE_FIELDS, per_page, offset=offset))
+
+    return {
+        'employees': page_obj,
+        'department': department,
+        'page_obj': page_obj,
+        'include_subtree': include_subtree,
+    }
+
+
+def cursor_context(department, include_subtree, per_page, after=None, before=None) -> dict:
+    """Страница seek-пагинации; InvalidCursor - некорректный курсор"""
+    dept_path = department['path']
+    branch_paths = get_branch_paths(dept_path, department['id']) if include_subtree else None
+    if branch_paths is not None and can_merge(len(branch_paths), per_page + 1):
+        page = keyset_page(branch_paths, EMPLOYEE_FIELDS, per_page, after=after, before=before)
+    else:
+        employees = department_employees(dept_path, include_subtree).select_related('department')
+        page = keyset_paginate(employees, per_page, after=after, before=before)
+
+    return {
+        'employees': page.employees,
+        'department': department,
+        'cursor_page': page,
+        'include_subtree': include_subtree,
+    }
+
+
+def page_payload(context, request=None) -> dict:
+    page_obj = context['page_obj']
+    return {
+        'html': render_to_string(TEMPLATE, context, request=request),
+        'has_previous': page_obj.has_previous(),
+        'has_next': page_obj.has_next(),
+        'current_page': page_obj.number,
+        'num_pages': page_obj.paginator.num_pages,
+        'total_count': page_obj.paginator.count,
+    }
+
+
+def cursor_payload(context, request=None) -> dict:
+    page = context['cursor_page']
+    return {
+        'html': render_to_string(TEMPLATE, context, request=request),
+        'has_previous': page.has_previous,
+        'has_next': page.has_next,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+        'total_count': get_total_count(context['department'], context['include_subtree']),
+    }
+
+
+def build_payload(department, include_subtree, page, per_page, after=None) -> dict:
+    """AJAX-ответ страницы page (номер или FIRST_CURSOR_PAGE); HTML не зависит от запроса"""
+    if page == FIRST_CURSOR_PAGE:
+        return cursor_payload(cursor_context(department, include_subtree, per_page, after=after))
+    return page_payload(page_context(department, include_subtree, page, per_page))
+
+
+def is_cacheable(page) -> bool:
+    if not settings.EMPLOYEE_PAGE_CACHE:
+        return False
+    return page == FIRST_CURSOR_PAGE or page <= settings.EMPLOYEE_PAGE_CACHE_PAGES
+
+
+def page_key(versions: tuple[int, int], department_id: int, include_subtree: bool, page, per_page: int) -> str:
+    """Ключ кеша страницы; versions - (версия структуры, версия страниц отдела) из page_versions"""
+    structure_version, version = versions
+    return f"{PAGES}:{structure_version}:{department_id}:{version}:{int(include_subtree)}:{page}:{per_page}"
+
+
+def _version_key(department_id: int) -> str:
+    return f"{PAGE_VERSION}:{department_id}"
+
+
+def _new_version() -> int:
+    """Начальная версия страниц (в том числе после вытеснения ключа): больше любой прежней"""
+    return int(time.time() * 1000)
+
+
+def page_versions(department_ids) -> dict[int, tuple[int, int]]:
+    """
+    {отдел: (версия структуры, версия страниц)} одним get_many. Читается до данных страницы:
+    построенная после этого страница не старее версии, под которой ляжет в кеш.
+    """
+    keys = {_version_key(dept_id): dept_id for dept_id in department_ids}
+    values = cache.get_many([STRUCTURE_VERSION_KEY, *keys])
+    structure_version = values.pop(STRUCTURE_VERSION_KEY, None) or get_structure_version()
+    missing = {key: _new_version() for key in keys if key not in values}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, timeout=None)
+        values.update(cache.get_many(list(missing)))
+    return {dept_id: (structure_version, values.get(key, 0)) for key, dept_id in keys.items()}
+
+
+async def apage_versions(department_ids) -> dict[int, tuple[int, int]]:
+    """page_versions для async-views"""
+    keys = {_version_key(dept_id): dept_id for dept_id in department_ids}
+    values = await async_cache.aget_many([STRUCTURE_VERSION_KEY, *keys])
+    structure_version = values.pop(STRUCTURE_VERSION_KEY, None) or await aget_structure_version()
+    for key in keys:
+        if key not in values:
+            await async_cache.aadd(key, _new_version(), timeout=None)
+            values[key] = await async_cache.aget(key, 0)
+    return {dept_id: (structure_version, values[key]) for key, dept_id in keys.items()}
+
+
+def with_current_counts(departments) -> dict[int, dict]:
+    """
+    Отделы с численностью из DepartmentStats - для страниц, которые кладутся в кеш: индекс
+    дерева может отдавать последний снимок, отстающий от версии страниц, и в кеше надолго
+    остался бы старый итог.
+    """
+    departments = {department['id']: department for department in departments}
+    counts = DepartmentStats.objects.filter(department_id__in=list(departments)).values_list(
+        'department_id', 'direct_count', 'subtree_count'
+    )
+    for dept_id, direct_count, subtree_count in counts:
+        departments[dept_id] = {
+            **departments[dept_id], 'employees_count': direct_count, 'subtree_count': subtree_count
+        }
+    return departments
+
+
+def get_page_payload(department, include_subtree, page, per_page) -> dict:
+    if not is_cacheable(page):
+        return build_payload(department, include_subtree, page, per_page)
+
+    key = page_key(page_versions([department['id']])[department['id']],
+                   department['id'], include_subtree, page, per_page)
+    payload = cache.get(key)
+    if payload is None:
+        # В кеш на сутки - только страница из основной БД, не с отстающей реплики
+        with use_primary():
+            department = with_current_counts([department])[department['id']]
+            payload = build_payload(department, include_subtree, page, per_page)
+        cache.set(key, payload, settings.DEPARTMENT_TREE_CACHE_TTL)
+    return payload
+
+
+def invalidate_pages(department_ids) -> None:
+    """
+    Страницы отделов department_ids и всех их предков устарели (вызывается после коммита).
+    Предки - по пути из индекса дерева: если он еще не знает о переносе отдела, страницы
+    все равно сменят ключ вместе с версией структуры.
+    """
+    lineage = set()
+    for dept_id in department_ids:
+        path = get_department_path(dept_id)
+        if path:
+            lineage.update(int(label) for label in path.split("."))
+    bump_page_versions(lineage)
+
+
+def bump_page_versions(department_ids) -> None:
+    """Новые версии страниц отделов (их предков вызывающий код уже добавил сам)"""
+    department_ids = list(department_ids)
+    for dept_id in department_ids:
+        try:
+            cache.incr(_version_key(dept_id))
+        except ValueError:
+            cache.add(_version_key(dept_id), _new_version(), timeout=None)
+    if department_ids and settings.EMPLOYEE_PAGE_CACHE and settings.EMPLOYEE_PAGE_WARM_ON_CHANGE:
+        _log_changes(department_ids)
+
+
+def _log_changes(department_ids) -> None:
+    try:
+        seq = cache.incr(CHANGES_SEQ)
+    except ValueError:
+        cache.add(CHANGES_SEQ, 0, timeout=None)
+        seq = cache.incr(CHANGES_SEQ)
+    cache.set(f"{CHANGES}:{seq}", department_ids, CHANGES_TTL)
+
+
+def changes_seq() -> int:
+    return cache.get(CHANGES_SEQ, 0)
+
+
+def read_changes(after_seq: int) -> tuple[int, set[int] | None]:
+    """
+    Отделы из записей журнала после after_seq: (номер последней записи, отделы).
+    None - записей слишком много или журнал потерян (вытеснен из кеша): греть все отделы.
+    Запись, которую писатель еще не успел положить после incr, пропускается - прогрев
+    не гарантирован, страница тогда построится по первому запросу.
+    """
+    seq = changes_seq()
+    if seq == after_seq:
+        return seq, set()
+    if seq < after_seq or seq - after_seq > MAX_CHANGES_READ:
+        return seq, None
+    entries = cache.get_many([f"{CHANGES}:{number}" for number in range(after_seq + 1, seq + 1)])
+    return seq, {dept_id for department_ids in entries.values() for dept_id in department_ids}
+
+
+@dataclass(frozen=True)
+class PageRequest:
+    """Страница одного отдела в batch_payloads; after - курсор для page=FIRST_CURSOR_PAGE"""
+    department: dict
+    include_subtree: bool
+    page: int | str
+    per_page: int
+    after: str | None = None
+
+
+def batch_payloads(requests: list[PageRequest]) -> list[dict]:
+    """
+    AJAX-ответы страниц requests (в том же порядке). Закешированные читаются одним get_many,
+    остальные - запросом subtree.window_query: пути веток берутся из индекса дерева. Страницы,
+    которые лягут в кеш, строятся отдельным запросом к основной БД.
+    InvalidCursor - некорректный after.
+    """
+    requests = list(requests)
+    payloads = [None] * len(requests)
+    cacheable = [
+        number for number, request in enumerate(requests)
+        if not request.after and is_cacheable(request.page)
+    ]
+    versions = page_versions({requests[number].department['id'] for number in cacheable}) if cacheable else {}
+    keys = {}
+    for number in cacheable:
+        request = requests[number]
+        department_id = request.department['id']
+        key = page_key(versions[department_id], department_id, request.include_subtree, request.page, request.per_page)
+        keys[key] = number
+    for key, payload in cache.get_many(list(keys)).items():
+        payloads[keys.pop(key)] = payload
+    if keys:
+        # Страницы для кеша - по основной БД (как в get_page_payload), остальные - где читает view
+        with use_primary():
+            current = with_current_counts([requests[number].department for number in keys.values()])
+            for number in keys.values():
+                requests[number] = replace(requests[number], department=current[requests[number].department['id']])
+            _build_payloads(requests, list(keys.values()), payloads)
+        cache.set_many(
+            {key: payloads[number] for key, number in keys.items()}, settings.DEPARTMENT_TREE_CACHE_TTL
+        )
+    _build_payloads(requests, [number for number, payload in enumerate(payloads) if payload is None], payloads)
+    return payloads
+
+
+def _build_payloads(requests: list[PageRequest], missing: list[int], payloads: list) -> None:
+    """Строит payloads[number] для номеров missing: по возможности одним оконным запросом"""
+    if not missing:
+        return
+    branch_paths = get_branch_paths_many([
+        requests[number].department for number in missing if requests[number].include_subtree
+    ])
+    batches = []
+    batched = []
+    for number in missing:
+        request = requests[number]
+        department = request.department
+        paths = branch_paths[department['id']] if request.include_subtree else [department['path']]
+        if request.page == FIRST_CURSOR_PAGE:
+            after = decode_cursor(request.after) if request.after else None
+            limit, offset = request.per_page + 1, 0
+        else:
+            after = None
+            limit, offset = request.per_page, (request.page - 1) * request.per_page
+        if can_window(len(paths), limit + offset):
+            batches.append((paths, limit, offset, after))
+            batched.append(number)
+        else:
+            # Дальняя страница или большое поддерево - отдельным запросом, как в DepartmentEmployeesView
+            payloads[number] = build_payload(
+                department, request.include_subtree, request.page, request.per_page, after=request.after
+            )
+
+    pages = defaultdict(list)
+    if batches:
+        for row in fetch_rows(*window_query(batches, EMPLOYEE_FIELDS)):
+            pages[row['batch']].append({name: row[name] for name in EMPLOYEE_FIELDS})
+    for batch, number in enumerate(batched):
+        payloads[number] = _batch_payload(requests[number], pages[batch])
+
+
+def _batch_payload(request: PageRequest, employees: list[dict]) -> dict:
+    context = {'department': request.department, 'include_subtree': request.include_subtree}
+    per_page = request.per_page
+    if request.page == FIRST_CURSOR_PAGE:
+        page = KeysetPage(
+            employees=employees[:per_page],
+            has_next=len(employees) > per_page,
+            has_previous=bool(request.after),
+        )
+        return cursor_payload({**context, 'employees': page.employees, 'cursor_page': page})
+
+    paginator = CountedPaginator((), per_page, count=get_total_count(request.department, request.include_subtree))
+    page_obj = paginator.get_page(request.page)
+    page_obj.object_list = employees
+    return page_payload({**context, 'employees': page_obj, 'page_obj': page_obj})
+
+
+def warm_pages(per_page: int = DEFAULT_PER_PAGE, force: bool = False, department_ids=None) -> int:
+    """
+    Строит первые страницы отделов department_ids (по умолчанию всех): курсорную и первую по
+    номеру, с поддеревом и без, и кладет в кеш. Уже закешированные пропускаются, если не force.
+    Останавливается, как только сменилась структура дерева. Возвращает число построенных страниц.
+    """
+    with use_primary():
+        return _warm_pages(per_page, force, department_ids)
+
+
+def _warm_pages(per_page: int, force: bool, department_ids) -> int:
+    snapshot = get_tree_snapshot()
+    if department_ids is None:
+        department_ids = list(snapshot["nodes"])
+    versions = page_versions(department_ids)
+    if not versions:
+        return 0
+    structure_version = next(iter(versions.values()))[0]
+    if snapshot.get("structure_version") != structure_version:
+        # Снимок текущей структуры еще строит другой воркер
+        snapshot = build_snapshot(get_tree_version())
+    # Численность - после версий страниц: ни одна страница не окажется старее своего ключа
+    departments = with_current_counts(
+        snapshot["nodes"][dept_id] for dept_id in versions if dept_id in snapshot["nodes"]
+    )
+
+    started = time.perf_counter()
+    built = 0
+    pages = [
+        (include_subtree, page)
+        for include_subtree in (False, True)
+        for page in (FIRST_CURSOR_PAGE, 1)
+        if is_cacheable(page)
+    ]
+    for department in departments.values():
+        if get_structure_version() != structure_version:
+            logger.info("employee_pages_warm_outdated", structure_version=structure_version, pages=built)
+            return built
+
+        keys = {
+            page_key(versions[department['id']], department['id'], include_subtree, page, per_page):
+                (include_subtree, page)
+            for include_subtree, page in pages
+        }
+        if not force:
+            for key in cache.get_many(list(keys)):
+                del keys[key]
+        payloads = {
+            key: build_payload(department, include_subtree, page, per_page)
+            for key, (include_subtree, page) in keys.items()
+        }
+        cache.set_many(payloads, settings.DEPARTMENT_TREE_CACHE_TTL)
+        built += len(payloads)
+
+    logger.info(
+        "employee_pages_warmed",
+        structure_version=structure_version,
+        departments=len(departments),
+        pages=built,
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+    return built
@@ -0,0 +1,68 @@
+"""
+Потоковая выгрузка сотрудников поддерева в CSV / NDJSON.
+
+Серверные курсоры отключены (DISABLE_SERVER_SIDE_CURSORS для пула соединений),
+поэтому строки читаются порциями по ключу id: каждая порция - отдельный короткий запрос,
+в памяти воркера одновременно не больше chunk_size строк.
+"""
+from __future__ import annotations
+
+import csv
+
+from org.utils.serializers import dumps, to_json_value
+
+from .models import Employee
+
+EXPORT_FIELDS = ('id', 'full_name', 'position', 'hired_at', 'salary', 'department_id')
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_employee_rows(dept_path: str, include_subtree: bool = True, chunk_size: int = 2000,
+                       using: str | None = None):
+    """
+    Строки сотрудников (dict) порциями по id > последнего прочитанного.
+    using - БД явно: генератор дочитывается уже после выхода из view (и из db_router.use_replica).
+    """
+    employees = Employee.objects.using(using)
+    if include_subtree:
+        employees = employees.extra(where=["structure_path <@ %s::ltree"], params=[dept_path])
+    else:
+        employees = employees.filter(structure_path=dept_path)
+    employees = employees.order_by('id').values(*EXPORT_FIELDS)
+
+    last_id = 0
+    while True:
+        chunk = list(employees.filter(id__gt=last_id)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]['id']
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[name] for name in EXPORT_FIELDS])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield dumps({name: to_json_value(row[name]) for name in EXPORT_FIELDS}) + "\n"
+
+
+def iter_export(dept_path: str, export_format: str, include_subtree: bool = True, using: str | None = None):
+    rows = iter_employee_rows(dept_path, include_subtree, using=using)
+    if export_format == 'csv':
+        return iter_csv(rows)
+    return iter_ndjson(rows)
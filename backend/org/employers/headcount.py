@@ -0,0 +1,52 @@
+"""
+Рассылка изменений численности отделов подписчикам websocket (consumers.HeadcountConsumer).
+
+Изменение - {department_id: (direct_delta, subtree_delta)}, как его возвращают методы
+DepartmentStatsManager. Отправляется в группу channel layer после коммита транзакции;
+склеивание и отправка клиенту пачками раз в HEADCOUNT_PUSH_INTERVAL_MS - на стороне consumer.
+"""
+from __future__ import annotations
+
+from functools import partial
+
+import structlog
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+logger = structlog.get_logger(__name__)
+
+HEADCOUNT_GROUP = "department_headcount"
+
+
+def merge_deltas(target: dict, deltas: dict) -> dict:
+    """Складывает изменения deltas в target (ключи - id отделов строкой, как в JSON)"""
+    for dept_id, (direct, subtree) in deltas.items():
+        key = str(dept_id)
+        old_direct, old_subtree = target.get(key, (0, 0))
+        target[key] = (old_direct + direct, old_subtree + subtree)
+    return target
+
+
+def publish_headcount(deltas: dict) -> None:
+    """Отправляет изменения после коммита; нулевые (перевод внутри поддерева предка) отбрасываются"""
+    if not settings.HEADCOUNT_PUSH:
+        return
+    deltas = {key: value for key, value in merge_deltas({}, deltas).items() if value != (0, 0)}
+    if deltas:
+        transaction.on_commit(partial(send_headcount, deltas))
+
+
+def send_headcount(deltas: dict) -> None:
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            HEADCOUNT_GROUP,
+            {"type": "headcount.delta", "deltas": {key: list(value) for key, value in deltas.items()}},
+        )
+    except Exception:
+        # Рассылка - best effort: недоступный Redis не должен ломать запись сотрудника
+        logger.warning("headcount_push_failed", departments=len(deltas), exc_info=True)
@@ -0,0 +1,377 @@
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from org.employers import tree_cache, tree_index
+from org.employers.management.commands.generate_test_data import EMPLOYEE_COLUMNS, employee_rows
+from org.employers.models import Department, DepartmentStats
+from org.utils.db import copy_rows
+
+# Максимум SQL-запросов на один прогон сценария: рост числа запросов - регрессия
+QUERY_BUDGETS = {
+    "tree_view_cold": 1,
+    "tree_view_warm": 0,
+    # Отдел, путь, численность и ветки поддерева - из индекса дерева, в БД только сама страница
+    "employees_direct_page_first": 1,
+    "employees_direct_page_deep": 1,
+    "employees_subtree_page_first": 1,
+    "employees_subtree_page_deep": 1,
+    # Первые страницы всех детей отдела одним оконным запросом (/employees/batch/)
+    "employees_batch_children": 1,
+    # Первая страница из кеша готовых страниц (employee_pages.py)
+    "employees_page_cached": 0,
+    # full_clean, проверка глубины, savepoint'ы atomic и три UPDATE переноса
+    "department_reparent": 16,
+}
+# Без бюджета запросов: COPY идет через курсор драйвера мимо execute_wrapper, поэтому
+# employees_bulk_insert сравнивается по rows_per_s
+
+AJAX = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+
+
+class QueryCounter:
+    """execute_wrapper, считающий SQL-запросы (CaptureQueriesContext сбивается на reset_queries в запросе)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Записи сценария откатываются: данные одинаковые для каждого прогона и между запусками"""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+@contextmanager
+def isolated_cache():
+    """
+    Кеш с отдельным KEY_PREFIX: сценарии сбрасывают версию дерева и кладут страницы, не трогая
+    кеш работающего приложения. Снимок и индекс в памяти процесса сбрасываются на входе и выходе.
+    """
+    caches = {
+        alias: {**config, "KEY_PREFIX": f"{config.get('KEY_PREFIX', '')}benchmark"}
+        for alias, config in settings.CACHES.items()
+    }
+    tree_cache._local_values.clear()
+    tree_index._index = None
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        tree_cache._local_values.clear()
+        tree_index._index = None
+
+
+@contextmanager
+def quiet_request_logs():
+    """request_started/request_finished на каждый прогон только мешают читать отчет"""
+    request_logger = logging.getLogger("django_structlog")
+    level = request_logger.level
+    request_logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        request_logger.setLevel(level)
+
+
+def timings(durations):
+    durations = sorted(durations)
+    return {
+        "runs": len(durations),
+        "min_ms": round(durations[0], 2),
+        "median_ms": round(statistics.median(durations), 2),
+        "p95_ms": round(durations[max(round(len(durations) * 0.95) - 1, 0)], 2),
+        "max_ms": round(durations[-1], 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк дерева, списка сотрудников и записи: время прогонов, проверка числа SQL-запросов '
+        'и JSON-отчет для сравнения между коммитами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Количество замеров на сценарий')
+        parser.add_argument('--deep-page', type=int, default=1000, help='Номер "глубокой" страницы списка')
+        parser.add_argument('--per-page', type=int, default=10, help='Сотрудников на странице')
+        parser.add_argument('--bulk-size', type=int, default=10_000, help='Сотрудников в замере массовой вставки')
+        parser.add_argument('--output', default=None, help='Файл для JSON-отчета')
+        parser.add_argument('--baseline', default=None, help='JSON-отчет прошлого запуска для сравнения')
+        parser.add_argument(
+            '--generate', action='store_true',
+            help='Перед замерами пересоздать данные через generate_test_data (с --employees/--departments/--seed)',
+        )
+        parser.add_argument('--employees', type=int, default=100_000, help='Количество сотрудников для --generate')
+        parser.add_argument('--departments', type=int, default=25, help='Количество отделов для --generate')
+        parser.add_argument('--seed', type=int, default=42, help='Seed для --generate')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or options['per_page'] < 1 or options['bulk_size'] < 1:
+            raise CommandError('--repeat, --per-page и --bulk-size должны быть положительными')
+
+        if options['generate']:
+            call_command(
+                'generate_test_data',
+                employees=options['employees'],
+                departments=options['departments'],
+                seed=options['seed'],
+                stdout=self.stdout,
+            )
+
+        if not Department.objects.exists():
+            raise CommandError('Нет отделов: запустите generate_test_data или benchmark --generate')
+
+        self.repeat = options['repeat']
+        self.results = {}
+        self.client = Client()
+
+        with quiet_request_logs(), isolated_cache():
+            self.bench_tree_view()
+            # Замеры самих запросов к БД - мимо кеша страниц
+            with override_settings(EMPLOYEE_PAGE_CACHE=False):
+                self.bench_employees_view(options['per_page'], options['deep_page'])
+                self.bench_batch_pages(options['per_page'])
+            self.bench_cached_page(options['per_page'])
+            self.bench_reparent()
+            self.bench_bulk_insert(options['bulk_size'])
+
+        report = {
+            "meta": self.meta(options),
+            "results": self.results,
+        }
+        self.print_report(report, options['baseline'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Отчет записан в {options['output']}")
+
+        over_budget = [
+            f"{name}: {result['queries']} > {result['max_queries']}"
+            for name, result in self.results.items()
+            if result['max_queries'] is not None and result['queries'] > result['max_queries']
+        ]
+        if over_budget:
+            raise CommandError(f"Превышено число запросов: {'; '.join(over_budget)}")
+
+    # ---- сценарии ----
+
+    def measure(self, name, run, setup=None, **extra):
+        """Первый прогон - прогрев и подсчет запросов, затем repeat замеров времени"""
+        if setup:
+            setup()
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            run()
+
+        durations = []
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            run()
+            durations.append((time.perf_counter() - started) * 1000)
+
+        self.results[name] = {
+            "queries": queries.count,
+            "max_queries": QUERY_BUDGETS.get(name),
+            **timings(durations),
+            **extra,
+        }
+
+    def get(self, path, params=None, **headers):
+        response = self.client.get(path, params, **headers)
+        if response.status_code != 200:
+            raise CommandError(f"{path} {params}: HTTP {response.status_code}")
+        return response
+
+    def bench_tree_view(self):
+        def invalidate():
+            tree_cache.bump_tree_version()
+            tree_cache._local_values.clear()
+
+        self.measure("tree_view_cold", lambda: self.get("/"), setup=invalidate)
+        self.measure("tree_view_warm", lambda: self.get("/"))
+
+    def bench_employees_view(self, per_page, deep_page):
+        largest_direct = DepartmentStats.objects.order_by("-direct_count").first()
+        largest_subtree = DepartmentStats.objects.order_by("-subtree_count").first()
+        if largest_direct is None:
+            raise CommandError('Нет статистики отделов: запустите generate_test_data')
+
+        for mode, stats, count, include_subtree in (
+            ("direct", largest_direct, largest_direct.direct_count, "false"),
+            ("subtree", largest_subtree, largest_subtree.subtree_count, "true"),
+        ):
+            num_pages = max((count + per_page - 1) // per_page, 1)
+            for depth, page in (("first", 1), ("deep", min(deep_page, num_pages))):
+                params = {
+                    "department_id": stats.department_id,
+                    "include_subtree": include_subtree,
+                    "per_page": per_page,
+                    "page": page,
+                }
+                self.measure(
+                    f"employees_{mode}_page_{depth}",
+                    lambda params=params: self.get("/employees/", params, **AJAX),
+                    department_id=stats.department_id,
+                    page=page,
+                    employees=count,
+                )
+
+    def bench_batch_pages(self, per_page):
+        """Раскрытие отдела с наибольшим числом детей: первые страницы поддеревьев детей одним запросом"""
+        parent = (
+            Department.objects.filter(children__isnull=False)
+            .annotate(children_count=Count("children"))
+            .order_by("-children_count")
+            .first()
+        )
+        if parent is None:
+            self.stderr.write("employees_batch_children пропущен: нет отделов с дочерними отделами")
+            return
+        child_ids = list(parent.children.values_list("id", flat=True))
+        params = {
+            "department_id": child_ids,
+            "include_subtree": "true",
+            "pagination": "cursor",
+            "per_page": per_page,
+        }
+        self.measure(
+            "employees_batch_children",
+            lambda: self.get("/employees/batch/", params, **AJAX),
+            department_id=parent.pk,
+            departments=len(child_ids),
+        )
+
+    def bench_cached_page(self, per_page):
+        """Раскрытие отдела в дереве: первая страница курсорной пагинации, уже лежащая в кеше"""
+        stats = DepartmentStats.objects.order_by("-subtree_count").first()
+        params = {"department_id": stats.department_id, "pagination": "cursor", "per_page": per_page}
+        self.get("/employees/", params, **AJAX)
+        self.measure(
+            "employees_page_cached",
+            lambda: self.get("/employees/", params, **AJAX),
+            department_id=stats.department_id,
+        )
+
+    def bench_reparent(self):
+        """Перенос самого большого отдела 3 уровня под другой отдел 2 уровня и обратно"""
+        department = (
+            Department.objects.filter(level=3).select_related("stats").order_by("-stats__subtree_count").first()
+        )
+        target = department and Department.objects.filter(level=2).exclude(pk=department.parent_id).first()
+        if target is None:
+            self.stderr.write("department_reparent пропущен: нужно минимум два отдела 2 уровня и отдел 3 уровня")
+            return
+
+        def run():
+            with rolled_back():
+                moved = Department.objects.get(pk=department.pk)
+                moved.parent = target
+                moved.save()
+
+        self.measure(
+            "department_reparent",
+            run,
+            department_id=department.pk,
+            employees=department.stats.subtree_count,
+        )
+
+    def bench_bulk_insert(self, bulk_size):
+        departments = [(dept.pk, ".".join(dept.path)) for dept in Department.objects.only("pk", "path")]
+
+        def run():
+            with rolled_back(), connection.cursor() as cursor:
+                copy_rows(cursor, "employers_employee", EMPLOYEE_COLUMNS, employee_rows(0, bulk_size, 0, departments))
+
+        self.measure("employees_bulk_insert", run, employees=bulk_size)
+        result = self.results["employees_bulk_insert"]
+        result["rows_per_s"] = round(bulk_size / result["median_ms"] * 1000)
+
+    # ---- отчет ----
+
+    def meta(self, options):
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW server_version")
+            server_version = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT count(*), max(level) FROM employers_department"
+            )
+            departments, depth = cursor.fetchone()
+        employees = sum(DepartmentStats.objects.values_list("direct_count", flat=True))
+        return {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "postgres": server_version,
+            "departments": departments,
+            "depth": depth,
+            "employees": employees,
+            "repeat": options['repeat'],
+            "per_page": options['per_page'],
+            "bulk_size": options['bulk_size'],
+        }
+
+    def print_report(self, report, baseline_path):
+        baseline = {}
+        if baseline_path:
+            with open(baseline_path, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)["results"]
+
+        meta = report["meta"]
+        self.stdout.write(
+            f"commit={meta['commit']} departments={meta['departments']} depth={meta['depth']} "
+            f"employees={meta['employees']} repeat={meta['repeat']}"
+        )
+        self.stdout.write(f"{'сценарий':<32}{'запросы':>9}{'median, мс':>12}{'p95, мс':>10}{'baseline':>12}")
+        for name, result in report["results"].items():
+            budget = "-" if result["max_queries"] is None else result["max_queries"]
+            queries = f"{result['queries']}/{budget}"
+            line = f"{name:<32}{queries:>9}{result['median_ms']:>12.2f}{result['p95_ms']:>10.2f}"
+            previous = baseline.get(name)
+            if previous and previous["median_ms"]:
+                change = (result["median_ms"] / previous["median_ms"] - 1) * 100
+                line += f"{change:>+11.1f}%"
+            if "rows_per_s" in result:
+                line += f"  {result['rows_per_s']} строк/с"
+            if result["max_queries"] is not None and result["queries"] > result["max_queries"]:
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
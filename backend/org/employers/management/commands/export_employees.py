@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from org.employers.export import EXPORT_FORMATS, iter_export
+from org.employers.models import Department
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка сотрудников отдела (с поддеревом) в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('department_id', type=int, help='id отдела')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='Формат выгрузки')
+        parser.add_argument('--output', default='-', help='Файл для записи, "-" - stdout')
+        parser.add_argument('--no-subtree', action='store_true', help='Только сотрудники самого отдела')
+
+    def handle(self, *args, **options):
+        try:
+            department = Department.objects.get(pk=options['department_id'])
+        except Department.DoesNotExist:
+            raise CommandError(f"Отдел {options['department_id']} не найден")
+
+        chunks = iter_export('.'.join(department.path), options['format'], not options['no_subtree'])
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Выгрузка записана в {options['output']}"))
@@ -1,123 +1,193 @@
+import multiprocessing
 import random
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
-from decimal import Decimal
 
-from django.core.management.base import BaseCommand
-from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from django.utils import timezone
-from org.employers.models import Department, Employee
+from org.employers.models import Department, DepartmentStats
+from org.employers.tree_cache import bump_tree_version
+from org.utils.db import copy_rows
+from org.utils.db_pool import close_pools
+
+POSITIONS = [
+    "Менеджер", "Разработчик", "Аналитик", "Дизайнер",
+    "Тестировщик", "Руководитель", "Специалист", "Консультант"
+]
+FIRST_NAMES = ["Иван", "Петр", "Сергей", "Александр", "Дмитрий", "Андрей"]
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов"]
+LEVEL_NAMES = {1: "Главное управление", 2: "Управление", 3: "Отдел", 4: "Сектор", 5: "Группа"}
+
+EMPLOYEE_COLUMNS = ["full_name", "position", "hired_at", "salary", "department_id", "structure_path"]
+# Сотрудники генерируются блоками со своим seed (seed:номер блока), а процессы получают
+# целые блоки - данные при одном --seed не зависят от --workers
+SEED_CHUNK = 10_000
+
+
+def employee_rows(start, stop, seed, departments):
+    """
+    Генератор строк сотрудников [start, stop) для COPY; departments - список (id, path).
+    start должен быть кратен SEED_CHUNK.
+    """
+    today = timezone.now().date()
+    hire_dates = [(today - timedelta(days=days)).isoformat() for days in range(3651)]
+
+    for i in range(start, stop):
+        if i % SEED_CHUNK == 0:
+            rng = random.Random(f"{seed}:{i // SEED_CHUNK}")
+        dept_id, dept_path = departments[rng.randrange(len(departments))]
+        yield (
+            f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {i}",
+            rng.choice(POSITIONS),
+            rng.choice(hire_dates),
+            rng.randint(30000, 300000),
+            dept_id,
+            dept_path,
+        )
+
+
+def copy_employees_chunk(start, stop, seed, departments):
+    """Загрузка одного диапазона сотрудников (выполняется в отдельном процессе)"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        copy_rows(cursor, "employers_employee", EMPLOYEE_COLUMNS, employee_rows(start, stop, seed, departments))
+    return stop - start
 
 
 class Command(BaseCommand):
-    help = 'Генерирует тестовые данные: 25 отделов в 5 уровнях'
+    help = 'Генерирует тестовые данные: дерево отделов и сотрудников, загрузка через COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=100_000, help='Количество сотрудников')
+        parser.add_argument('--departments', type=int, default=25, help='Количество отделов')
+        parser.add_argument('--depth', type=int, default=Department.MAX_LEVEL, help='Глубина дерева')
+        parser.add_argument(
+            '--fanout', type=int, default=None,
+            help='Максимум дочерних отделов у узла (по умолчанию - наименьший, при котором дерево '
+                 'глубины --depth вмещает --departments)',
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Seed генератора для воспроизводимых данных')
+        parser.add_argument('--workers', type=int, default=1, help='Количество процессов для загрузки сотрудников')
 
     def handle(self, *args, **options):
-        self.stdout.write('Генерация тестовых данных...')
-
-        Employee.objects.all().delete()
-        Department.objects.all().delete()
-
-        # Генерация отделов (25 отделов в 5 уровнях)
-        departments = self.create_departments()
-
-        # Генерация 50k сотрудников
-        self.create_employees(departments)
-
-        self.stdout.write(self.style.SUCCESS('Данные успешно созданы!'))
-
-    def create_departments(self):
-        """Создает 25 отделов в 5 уровнях иерархии"""
-        departments = []
+        if not 1 <= options['depth'] <= Department.MAX_LEVEL:
+            raise CommandError(f'--depth должен быть от 1 до {Department.MAX_LEVEL}')
+        if options['departments'] < options['depth']:
+            raise CommandError('--departments должен быть не меньше --depth')
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть положительным')
+        fanout = options['fanout']
+        if fanout is None:
+            fanout = self.min_fanout(options['departments'], options['depth'])
+        elif fanout < 1:
+            raise CommandError('--fanout должен быть положительным')
+        capacity = self.capacity(options['depth'], fanout)
+        if capacity < options['departments']:
+            raise CommandError(
+                f"Дерево глубины {options['depth']} с --fanout {fanout} вмещает не больше {capacity} "
+                f"отделов, а нужно {options['departments']}: увеличьте --fanout или --depth"
+            )
 
-        # Уровень 1: 1 отдел
-        dept1 = Department.objects.create(name="Главное управление")
-        departments.append(dept1)
+        seed = options['seed'] if options['seed'] is not None else random.randrange(2 ** 32)
+        self.stdout.write(f'Генерация тестовых данных (seed={seed})...')
 
-        # Уровень 2: 3 отдела
-        for i in range(1, 4):
-            dept = Department.objects.create(
-                name=f"Управление {i}",
-                parent=dept1
-            )
-            departments.append(dept)
-
-        # Уровень 3: 6 отделов (по 2 на каждый уровень 2)
-        level2_depts = [d for d in departments if d.level == 2]
-        for parent in level2_depts:
-            for i in range(1, 3):
-                dept = Department.objects.create(
-                    name=f"Отдел {parent.name} - {i}",
-                    parent=parent
-                )
-                departments.append(dept)
-
-        # Уровень 4: 9 отделов
-        level3_depts = [d for d in departments if d.level == 3]
-        for parent in level3_depts[:6]:
-            for i in range(1, 2):
-                dept = Department.objects.create(
-                    name=f"Сектор {parent.name} - {i}",
-                    parent=parent
-                )
-                departments.append(dept)
-
-        # Уровень 5: 6 отделов
-        level4_depts = [d for d in departments if d.level == 4]
-        for parent in level4_depts[:6]:
-            dept = Department.objects.create(
-                name=f"Группа {parent.name}",
-                parent=parent
+        # TRUNCATE вместо ORM delete(): без загрузки строк и post_delete-сигнала на каждого сотрудника
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "TRUNCATE employers_employee, employers_departmentstats, employers_department"
             )
-            departments.append(dept)
 
-        return departments
+        departments = self.create_departments(options['departments'], options['depth'], fanout)
+        self.stdout.write(f'Создано {len(departments)} отделов')
+
+        self.create_employees(departments, options['employees'], seed, options['workers'])
 
-    def create_employees(self, departments):
-        """Создает 50,000 сотрудников"""
-        positions = [
-            "Менеджер", "Разработчик", "Аналитик", "Дизайнер",
-            "Тестировщик", "Руководитель", "Специалист", "Консультант"
-        ]
+        # COPY обходит сигналы - пересчитываем численность отделов одним запросом
+        DepartmentStats.objects.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE employers_department, employers_employee, employers_departmentstats")
 
-        first_names = ["Иван", "Петр", "Сергей", "Александр", "Дмитрий", "Андрей"]
-        last_names = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов"]
+        bump_tree_version(structure=True)
 
-        employees = []
-        batch_size = 1000
+        self.stdout.write(self.style.SUCCESS('Данные успешно созданы!'))
 
-        # Получаем path для всех отделов одним запросом
-        dept_paths = {}
+    @staticmethod
+    def capacity(depth, fanout):
+        """Наибольшее число отделов в дереве глубины depth при fanout детей у узла"""
+        return sum(fanout ** level for level in range(depth))
+
+    def min_fanout(self, total, depth):
+        """Наименьший fanout, при котором дерево глубины depth вмещает total отделов"""
+        if depth == 1:
+            return 1
+        fanout = 1
+        while self.capacity(depth, fanout) < total:
+            fanout += 1
+        return fanout
+
+    def plan_levels(self, total, depth, fanout):
+        """
+        Количество отделов на каждом уровне: уровень заполняется максимально (fanout на родителя),
+        но на каждый следующий уровень оставляется хотя бы один отдел.
+        """
+        sizes = [1]
+        remaining = total - 1
+        for level in range(2, depth + 1):
+            reserve = depth - level
+            size = min(sizes[-1] * fanout, remaining - reserve)
+            sizes.append(size)
+            remaining -= size
+        return sizes
+
+    @transaction.atomic
+    def create_departments(self, total, depth, fanout):
+        """Строит дерево в Python и загружает одним COPY; возвращает список (id, path)"""
+        sizes = self.plan_levels(total, depth, fanout)
         with connection.cursor() as cursor:
             cursor.execute(
-                "SELECT id, path::text FROM employers_department"
+                "SELECT nextval(pg_get_serial_sequence('employers_department', 'id')) "
+                "FROM generate_series(1, %s)",
+                [sum(sizes)]
             )
-            for row in cursor.fetchall():
-                dept_paths[row[0]] = row[1]
-
-        for i in range(100_000):
-            dept = random.choice(departments)
-            first_name = random.choice(first_names)
-            last_name = random.choice(last_names)
-
-            # Получаем path отдела
-            dept_path = dept_paths.get(dept.id, str(dept.id))
-
-            employee = Employee(
-                full_name=f"{last_name} {first_name} {i}",
-                position=random.choice(positions),
-                hired_at=timezone.now().date() - timedelta(days=random.randint(0, 3650)),
-                salary=Decimal(str(random.randint(30000, 300000))),
-                department=dept,
-                structure_path=dept_path
-            )
-            employees.append(employee)
-
-            if len(employees) >= batch_size:
-                Employee.objects.bulk_create(employees)
-                employees = []
-                self.stdout.write(f'Создано {i + 1} сотрудников...')
-
-        if employees:
-            Employee.objects.bulk_create(employees)
-
-        self.stdout.write(self.style.SUCCESS(f'Создано {Employee.objects.count()} сотрудников'))
+            ids = iter(row[0] for row in cursor.fetchall())
+
+            rows = []
+            parents = [(None, "")]
+            for level, size in enumerate(sizes, start=1):
+                current = []
+                for i in range(size):
+                    parent_id, parent_path = parents[i % len(parents)]
+                    dept_id = next(ids)
+                    path = f"{parent_path}.{dept_id}" if parent_path else str(dept_id)
+                    rows.append((dept_id, f"{LEVEL_NAMES[level]} {dept_id}", parent_id, level, path))
+                    current.append((dept_id, path))
+                parents = current
+
+            # Строки идут по уровням, поэтому родитель всегда загружен раньше потомка
+            copy_rows(cursor, "employers_department", ["id", "name", "parent_id", "level", "path"], rows)
+
+        return [(dept_id, path) for dept_id, _, _, _, path in rows]
+
+    def create_employees(self, departments, total, seed, workers):
+        if workers == 1:
+            copy_employees_chunk(0, total, seed, departments)
+            self.stdout.write(self.style.SUCCESS(f'Создано {total} сотрудников'))
+            return
+
+        chunk = -(-total // workers)
+        chunk = -(-chunk // SEED_CHUNK) * SEED_CHUNK
+        bounds = [(start, min(start + chunk, total)) for start in range(0, total, chunk)]
+
+        # Дочерние процессы не должны унаследовать открытое соединение и пул родителя
+        close_pools()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            futures = [
+                pool.submit(copy_employees_chunk, start, stop, seed, departments)
+                for start, stop in bounds
+            ]
+            created = 0
+            for future in futures:
+                created += future.result()
+                self.stdout.write(f'Создано {created} сотрудников...')
+
+        self.stdout.write(self.style.SUCCESS(f'Создано {created} сотрудников'))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from org.employers.tree_triggers import TRIGGERS, drop_triggers, install_triggers, installed_triggers
+
+
+class Command(BaseCommand):
+    help = (
+        'Ставит (install), снимает (drop) или показывает (status) триггеры PostgreSQL, которые считают '
+        'path/level отделов и structure_path сотрудников. Включение режима: install, затем '
+        'DJANGO_TREE_TRIGGERS=true; выключение: DJANGO_TREE_TRIGGERS=false, затем drop'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['install', 'drop', 'status'])
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'install':
+            with transaction.atomic():
+                install_triggers()
+        elif action == 'drop':
+            if settings.DEPARTMENT_TREE_TRIGGERS:
+                raise CommandError(
+                    'DJANGO_TREE_TRIGGERS включен: без триггеров пути не будут заполняться, '
+                    'сначала выключите режим'
+                )
+            with transaction.atomic():
+                drop_triggers()
+
+        installed = installed_triggers()
+        for name in TRIGGERS:
+            self.stdout.write(f"{name}: {'есть' if name in installed else 'нет'}")
+        mode = 'включен' if settings.DEPARTMENT_TREE_TRIGGERS else 'выключен'
+        self.stdout.write(self.style.SUCCESS(
+            f'Триггеров в базе: {len(installed)} из {len(TRIGGERS)}, DJANGO_TREE_TRIGGERS {mode}'
+        ))
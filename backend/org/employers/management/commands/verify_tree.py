@@ -0,0 +1,144 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from org.employers.models import DepartmentStats
+from org.employers.tree_cache import bump_tree_version
+
+# Ожидаемые path/level по parent_id; отдел, до которого не дошла рекурсия, - в цикле
+EXPECTED_SQL = """
+    WITH RECURSIVE expected AS (
+        SELECT id, id::text::ltree AS path, 1 AS level
+        FROM employers_department
+        WHERE parent_id IS NULL
+        UNION ALL
+        SELECT d.id, e.path || d.id::text, e.level + 1
+        FROM employers_department d
+        JOIN expected e ON d.parent_id = e.id
+    )
+"""
+
+DEPARTMENT_DRIFT_SQL = EXPECTED_SQL + """
+    SELECT d.id, d.path::text, d.level, e.path::text, e.level
+    FROM employers_department d
+    LEFT JOIN expected e ON e.id = d.id
+    WHERE e.id IS NULL OR d.path <> e.path OR d.level <> e.level
+    ORDER BY d.id
+"""
+
+DEPARTMENT_FIX_SQL = EXPECTED_SQL + """
+    UPDATE employers_department d
+    SET path = e.path, level = e.level
+    FROM expected e
+    WHERE d.id = e.id AND (d.path <> e.path OR d.level <> e.level)
+"""
+
+# Порция сотрудников - диапазон первичного ключа [%s, %s): индексный скан без сортировки
+EMPLOYEE_DRIFT_SQL = """
+    SELECT count(*)
+    FROM employers_employee e
+    JOIN employers_department d ON d.id = e.department_id
+    WHERE e.id >= %s AND e.id < %s
+    AND e.structure_path IS DISTINCT FROM d.path
+"""
+
+EMPLOYEE_FIX_SQL = """
+    UPDATE employers_employee e
+    SET structure_path = d.path
+    FROM employers_department d
+    WHERE d.id = e.department_id
+    AND e.id >= %s AND e.id < %s
+    AND e.structure_path IS DISTINCT FROM d.path
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет денормализацию дерева: path/level отделов против пересчитанных по parent_id '
+        'и structure_path сотрудников против path их отдела. С --fix исправляет расхождения '
+        'UPDATE\'ами порциями по диапазонам id (можно запускать на работающей базе)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Исправить найденные расхождения')
+        parser.add_argument(
+            '--batch-size', type=int, default=50_000, help='Ширина диапазона id сотрудников в одном запросе'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0, help='Пауза между порциями сотрудников, секунды (нагрузка на БД)'
+        )
+        parser.add_argument('--show', type=int, default=20, help='Сколько расходящихся отделов показать')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        started = time.perf_counter()
+
+        departments_fixed = self.verify_departments(options['fix'], options['show'])
+        employees_drift = self.verify_employees(options['fix'], options['batch_size'], options['sleep'])
+
+        if options['fix'] and departments_fixed:
+            # subtree_count зависит от путей отделов
+            DepartmentStats.objects.rebuild()
+            self.stdout.write('Численность отделов пересчитана')
+        if options['fix'] and (departments_fixed or employees_drift):
+            bump_tree_version(structure=bool(departments_fixed))
+
+        elapsed = time.perf_counter() - started
+        if options['fix'] or not (departments_fixed or employees_drift):
+            self.stdout.write(self.style.SUCCESS(f'Готово за {elapsed:.1f} с'))
+            return
+        raise CommandError(f'Найдены расхождения ({elapsed:.1f} с), исправить: verify_tree --fix')
+
+    def verify_departments(self, fix: bool, show: int) -> int:
+        """Расходящиеся отделы; с fix - исправленные одним UPDATE (отделов немного)"""
+        with connection.cursor() as cursor:
+            cursor.execute(DEPARTMENT_DRIFT_SQL)
+            drift = cursor.fetchall()
+
+        cycles = [row for row in drift if row[3] is None]
+        fixable = [row for row in drift if row[3] is not None]
+        for dept_id, path, level, expected_path, expected_level in drift[:show]:
+            expected = 'не достижим от корня (цикл по parent_id)' if expected_path is None \
+                else f'ожидается {expected_path} (уровень {expected_level})'
+            self.stdout.write(f'  отдел {dept_id}: {path} (уровень {level}), {expected}')
+        self.stdout.write(f'Отделов с неверными path/level: {len(fixable)}, в циклах: {len(cycles)}')
+        if cycles:
+            self.stderr.write(self.style.WARNING('Циклы по parent_id автоматически не исправляются'))
+
+        if not fix or not fixable:
+            return 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(DEPARTMENT_FIX_SQL)
+            fixed = cursor.rowcount
+        self.stdout.write(f'Исправлено отделов: {fixed}')
+        return fixed
+
+    def verify_employees(self, fix: bool, batch_size: int, sleep: float) -> int:
+        """
+        Сотрудники, чей structure_path не равен path отдела. Каждая порция - отдельный
+        запрос в autocommit: блокировки строк держатся только на время одной порции.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT min(id), max(id) FROM employers_employee')
+            min_id, max_id = cursor.fetchone()
+        if min_id is None:
+            self.stdout.write('Сотрудников нет')
+            return 0
+
+        sql = EMPLOYEE_FIX_SQL if fix else EMPLOYEE_DRIFT_SQL
+        total = 0
+        started = time.perf_counter()
+        for low in range(min_id, max_id + 1, batch_size):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [low, low + batch_size])
+                total += cursor.rowcount if fix else cursor.fetchone()[0]
+            if sleep:
+                time.sleep(sleep)
+
+        action = 'Исправлено' if fix else 'Найдено'
+        self.stdout.write(
+            f'{action} сотрудников с неверным structure_path: {total} '
+            f'(id {min_id}..{max_id}, {time.perf_counter() - started:.1f} с)'
+        )
+        return total
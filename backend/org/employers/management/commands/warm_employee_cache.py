@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from org.employers.employee_pages import DEFAULT_PER_PAGE, changes_seq, read_changes, warm_pages
+from org.employers.tree_cache import get_structure_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Заранее строит и кладет в кеш первые страницы сотрудников всех отделов '
+        '(курсорную и первую по номеру, с поддеревом и без) для текущей версии дерева'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-page', type=int, default=DEFAULT_PER_PAGE, help='Сотрудников на странице')
+        parser.add_argument('--force', action='store_true', help='Перестроить и уже закешированные страницы')
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='После прогрева следить за журналом изменений и догревать затронутые отделы',
+        )
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза между чтениями журнала, с')
+
+    def handle(self, *args, **options):
+        if not settings.EMPLOYEE_PAGE_CACHE:
+            raise CommandError('Кеш страниц выключен (EMPLOYEE_PAGE_CACHE=false)')
+        if options['per_page'] < 1:
+            raise CommandError('--per-page должен быть положительным')
+        if options['watch'] and not settings.EMPLOYEE_PAGE_WARM_ON_CHANGE:
+            raise CommandError('Журнал изменений выключен (EMPLOYEE_PAGE_WARM_ON_CHANGE=false)')
+
+        # Номер записи журнала - до прогрева: изменения во время него догреются следующим шагом
+        seq = changes_seq()
+        structure_version = get_structure_version()
+        started = time.perf_counter()
+        built = warm_pages(per_page=options['per_page'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Построено страниц: {built} за {time.perf_counter() - started:.1f} с"
+        ))
+        if not options['watch']:
+            return
+
+        while True:
+            time.sleep(options['interval'])
+            current_structure = get_structure_version()
+            seq, department_ids = read_changes(seq)
+            if current_structure != structure_version or department_ids is None:
+                # Новая структура меняет ключи всех страниц, а потерянный журнал - неизвестно какие
+                structure_version = current_structure
+                built = warm_pages(per_page=options['per_page'])
+            elif department_ids:
+                built = warm_pages(per_page=options['per_page'], department_ids=department_ids)
+            else:
+                continue
+            self.stdout.write(f"Догрето страниц: {built}")
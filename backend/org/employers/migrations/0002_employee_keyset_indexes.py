@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['structure_path', 'full_name', 'id'], name='employers_e_structu_b93c51_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['full_name', 'id'], name='employers_e_full_na_b1c4cc_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Первичное заполнение: та же выборка, что и DepartmentStatsManager.rebuild
+POPULATE_SQL = """
+    WITH direct AS (
+        SELECT department_id, COUNT(*) AS cnt
+        FROM employers_employee
+        GROUP BY department_id
+    )
+    INSERT INTO employers_departmentstats (department_id, direct_count, subtree_count)
+    SELECT d.id,
+           COALESCE(dc.cnt, 0),
+           (
+               SELECT COALESCE(SUM(sub.cnt), 0)
+               FROM employers_department d2
+               JOIN direct sub ON sub.department_id = d2.id
+               WHERE d2.path <@ d.path
+           )
+    FROM employers_department d
+    LEFT JOIN direct dc ON dc.department_id = d.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employers', '0002_employee_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentStats',
+            fields=[
+                ('department', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='employers.department')),
+                ('direct_count', models.IntegerField(default=0, verbose_name='Сотрудников в отделе')),
+                ('subtree_count', models.IntegerField(default=0, verbose_name='Сотрудников в поддереве')),
+            ],
+            options={
+                'verbose_name': 'Численность отдела',
+                'verbose_name_plural': 'Численность отделов',
+            },
+        ),
+        migrations.RunSQL(POPULATE_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:26
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_enable_pg_trgm'),
+        ('employers', '0003_department_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops'), name='employee_full_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('position'), name='gin_trgm_ops'), name='employee_position_trgm'),
+        ),
+    ]
@@ -1,13 +1,34 @@
 from __future__ import annotations
 
 from decimal import Decimal
+from functools import partial
 
-from django.contrib.postgres.indexes import GistIndex
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
 from django.core.exceptions import ValidationError
 from django.db import connection, models, transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Upper
 from django_ltree_field.fields import LTreeField
 
 
+def _defer_db_computed(instance, *field_names):
+    """Сбрасывает поля, которые посчитала БД: при обращении Django дочитает их через refresh_from_db"""
+    for name in field_names:
+        instance.__dict__.pop(name, None)
+
+
+class DepartmentQuerySet(models.QuerySet):
+    def with_tree_info(self):
+        """Численность из DepartmentStats и признак наличия дочерних отделов - одним запросом"""
+        return self.annotate(
+            employees_count=Coalesce(F("stats__direct_count"), 0),
+            subtree_count=Coalesce(F("stats__subtree_count"), 0),
+            has_children=Exists(Department.objects.filter(parent_id=OuterRef("pk"))),
+        )
+
+
 class Department(models.Model):
     """
     Materialized path на ltree. Глубина ограничена 5 уровнями.
@@ -30,47 +51,83 @@ class Department(models.Model):
     level = models.PositiveIntegerField(default=1, editable=False)
     path = LTreeField(unique=True, editable=False)
 
+    objects = DepartmentQuerySet.as_manager()
+
     class Meta:
         indexes = [GistIndex(fields=["path"])]
         ordering = ["path"]
         verbose_name = "Отдел"
         verbose_name_plural = "Отделы"
 
+    # Поля дерева меняются только через SQL (save для новых, move_subtree для переносов)
+    TREE_FIELDS = frozenset({"parent", "parent_id", "level", "path"})
+
     def clean(self):
         """Валидация уровня вложенности"""
         if self.parent_id:
-            parent = Department.objects.only("level").get(pk=self.parent_id)
-            if parent.level >= self.MAX_LEVEL:
-                raise ValidationError(
-                    f"Максимальная глубина иерархии - {self.MAX_LEVEL} уровней"
+            self.validate_parent(Department.objects.only("level").get(pk=self.parent_id))
+
+    def validate_parent(self, parent: Department | None) -> None:
+        """
+        Проверяет, что поддерево отдела поместится под parent:
+        самый глубокий потомок не выходит за MAX_LEVEL и parent не лежит внутри поддерева.
+        """
+        if parent is None:
+            return
+
+        height = 1
+        if self.pk:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT max(nlevel(d.path)) - nlevel(me.path) + 1,
+                           bool_or(d.id = %s)
+                    FROM employers_department me
+                    JOIN employers_department d ON d.path <@ me.path
+                    WHERE me.id = %s
+                    GROUP BY me.path
+                    """,
+                    [parent.pk, self.pk]
                 )
+                row = cursor.fetchone()
+            if row:
+                height, parent_in_subtree = row
+                if parent_in_subtree:
+                    raise ValidationError("Нельзя перенести отдел внутрь собственного поддерева")
+
+        if parent.level + height > self.MAX_LEVEL:
+            raise ValidationError(
+                f"Максимальная глубина иерархии - {self.MAX_LEVEL} уровней"
+            )
 
     @transaction.atomic
     def save(self, *args, **kwargs):
         # Валидация перед сохранением
         self.full_clean()
 
-        is_new = self.pk is None
+        stored_parent_ids = (
+            list(Department.objects.filter(pk=self.pk).values_list("parent_id", flat=True))
+            if self.pk else []
+        )
+        if stored_parent_ids:
+            self._save_existing(stored_parent_ids[0], *args, **kwargs)
+            return
 
-        if is_new:
-            super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
+
+        if settings.DEPARTMENT_TREE_TRIGGERS:
+            # path и level уже посчитал триггер при INSERT, подгрузятся при обращении
+            _defer_db_computed(self, "path", "level")
+            return
 
         if self.parent_id:
             # Используем прямой SQL запрос для получения path из БД
             with connection.cursor() as cursor:
                 cursor.execute(
-                    "SELECT path::text FROM employers_department WHERE id = %s",
-                    [self.parent_id]
-                )
-                row = cursor.fetchone()
-                parent_path_str = row[0] if row and row[0] else str(self.parent_id)
-
-                cursor.execute(
-                    "SELECT level FROM employers_department WHERE id = %s",
+                    "SELECT path::text, level FROM employers_department WHERE id = %s",
                     [self.parent_id]
                 )
-                row = cursor.fetchone()
-                parent_level = row[0] if row else 0
+                parent_path_str, parent_level = cursor.fetchone()
 
             new_path = f"{parent_path_str}.{self.pk}"
             new_level = parent_level + 1
@@ -80,26 +137,103 @@ class Department(models.Model):
 
         with connection.cursor() as cursor:
             cursor.execute(
-                "SELECT path::text, level FROM employers_department WHERE id = %s",
+                "UPDATE employers_department SET path = %s::ltree, level = %s WHERE id = %s",
+                [new_path, new_level, self.pk]
+            )
+
+        self.path = new_path
+        self.level = new_level
+
+    def _save_existing(self, stored_parent_id, *args, **kwargs):
+        """Обычные поля пишем через ORM, смену родителя - через move_subtree"""
+        update_fields = kwargs.pop("update_fields", None)
+        if update_fields is None:
+            update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+        update_fields = [name for name in update_fields if name not in self.TREE_FIELDS]
+
+        if update_fields:
+            super().save(*args, update_fields=update_fields, **kwargs)
+
+        if self.parent_id != stored_parent_id:
+            # Нового родителя уже проверил full_clean() в save()
+            self.move_subtree(self.parent, validate=False)
+
+    @transaction.atomic
+    def move_subtree(self, new_parent: Department | None, validate: bool = True) -> None:
+        """
+        Переносит отдел со всем поддеревом под new_parent.
+        path/level всего поддерева переписываются одним UPDATE через subpath(),
+        structure_path сотрудников поддерева - вторым UPDATE, без обхода в Python.
+        validate=False - new_parent уже проверен validate_parent (save через full_clean).
+        """
+        from .headcount import publish_headcount
+        from .tree_cache import bump_tree_version
+        from .tree_index import mark_dirty
+
+        if validate:
+            self.validate_parent(new_parent)
+        mark_dirty()
+        transaction.on_commit(partial(bump_tree_version, structure=True))
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT path::text FROM employers_department WHERE id = %s FOR UPDATE",
                 [self.pk]
             )
-            row = cursor.fetchone()
-            if row:
-                current_path_str = row[0]
-                current_level = row[1]
+            old_path = cursor.fetchone()[0]
+
+            if new_parent is not None:
+                cursor.execute(
+                    "SELECT path::text FROM employers_department WHERE id = %s",
+                    [new_parent.pk]
+                )
+                parent_path = cursor.fetchone()[0]
+                new_path = f"{parent_path}.{self.pk}"
             else:
-                current_path_str = None
-                current_level = None
+                parent_path = ""
+                new_path = str(self.pk)
 
-        if current_path_str != new_path or current_level != new_level:
-            with connection.cursor() as cursor:
+            if new_path != old_path:
+                publish_headcount(DepartmentStats.objects.move_subtree(self.pk, old_path, new_path))
+
+            if settings.DEPARTMENT_TREE_TRIGGERS:
+                # Поддерево и сотрудников перепишет триггер на смену parent_id
                 cursor.execute(
-                    "UPDATE employers_department SET path = %s::ltree, level = %s WHERE id = %s",
-                    [new_path, new_level, self.pk]
+                    "UPDATE employers_department SET parent_id = %s WHERE id = %s",
+                    [new_parent.pk if new_parent else None, self.pk]
                 )
+                self.parent = new_parent
+                _defer_db_computed(self, "path", "level")
+                return
 
-            self.path = new_path
-            self.level = new_level
+            # "1.2.7.9" -> parent_path || "7.9": хвост пути начиная с самого переносимого отдела
+            cursor.execute(
+                """
+                UPDATE employers_department
+                SET path = %s::ltree || subpath(path, nlevel(%s::ltree) - 1),
+                    level = nlevel(%s::ltree || subpath(path, nlevel(%s::ltree) - 1)),
+                    parent_id = CASE WHEN id = %s THEN %s ELSE parent_id END
+                WHERE path <@ %s::ltree
+                """,
+                [parent_path, old_path, parent_path, old_path,
+                 self.pk, new_parent.pk if new_parent else None, old_path]
+            )
+
+            cursor.execute(
+                """
+                UPDATE employers_employee e
+                SET structure_path = d.path
+                FROM employers_department d
+                WHERE e.department_id = d.id
+                AND d.path <@ %s::ltree
+                AND e.structure_path IS DISTINCT FROM d.path
+                """,
+                [new_path]
+            )
+
+        self.parent = new_parent
+        self.path = new_path
+        self.level = new_path.count(".") + 1
 
     def __str__(self) -> str:
         return self.name
@@ -127,24 +261,190 @@ class Employee(models.Model):
     structure_path = LTreeField(editable=False, db_index=True)
 
     class Meta:
-        indexes = [GistIndex(fields=["structure_path"])]
+        indexes = [
+            GistIndex(fields=["structure_path"]),
+            # Ключи seek-пагинации (full_name, id): внутри отдела и по всему дереву
+            models.Index(fields=["structure_path", "full_name", "id"]),
+            models.Index(fields=["full_name", "id"]),
+            # Триграммы для поиска по подстроке: icontains в Django - это UPPER(col) LIKE UPPER(...)
+            GinIndex(OpClass(Upper("full_name"), name="gin_trgm_ops"), name="employee_full_name_trgm"),
+            GinIndex(OpClass(Upper("position"), name="gin_trgm_ops"), name="employee_position_trgm"),
+        ]
         verbose_name = "Сотрудник"
         verbose_name_plural = "Сотрудники"
         ordering = ["full_name"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный отдел, чтобы при переводе сотрудника поправить счетчики
+        instance._loaded_department_id = instance.__dict__.get("department_id")
+        return instance
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
+        if settings.DEPARTMENT_TREE_TRIGGERS:
+            super().save(*args, **kwargs)
+            _defer_db_computed(self, "structure_path")
+            return
+
         if self.department_id:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT path::text FROM employers_department WHERE id = %s",
-                    [self.department_id]
-                )
-                row = cursor.fetchone()
-                if row and row[0]:
-                    self.structure_path = row[0]
-                else:
-                    self.structure_path = str(self.department_id)
+            # Путь отдела читается подзапросом в самом INSERT/UPDATE, а не из кеша: FOR SHARE ждет
+            # коммита параллельного переноса отдела, и сотрудник не получит устаревший путь
+            self.structure_path = RawSQL(
+                "(SELECT path FROM employers_department WHERE id = %s FOR SHARE)",
+                [self.department_id],
+                output_field=LTreeField(),
+            )
         super().save(*args, **kwargs)
+        _defer_db_computed(self, "structure_path")
 
     def __str__(self) -> str:
         return self.full_name
+
+
+class DepartmentStatsManager(models.Manager):
+    """
+    Инкрементальное обновление численности.
+    Любое изменение затрагивает только строки предков отдела (<= MAX_LEVEL строк).
+    """
+
+    def add_employees(self, department_id: int, delta: int) -> dict[int, tuple[int, int]]:
+        """
+        Сдвигает direct_count отдела и subtree_count всех его предков (включая сам отдел).
+        Возвращает изменения {department_id: (direct_delta, subtree_delta)} для рассылки.
+        """
+        with connection.cursor() as cursor:
+            # Предки - по пути отдела из БД внутри UPDATE (не из индекса дерева в памяти:
+            # он узнает о переносе отдела только после коммита)
+            cursor.execute(
+                """
+                UPDATE employers_departmentstats s
+                SET subtree_count = s.subtree_count + %s,
+                    direct_count = s.direct_count + CASE WHEN s.department_id = %s THEN %s ELSE 0 END
+                FROM employers_department d
+                WHERE s.department_id = d.id
+                AND d.path @> (SELECT path FROM employers_department WHERE id = %s FOR SHARE)
+                RETURNING s.department_id
+                """,
+                [delta, department_id, delta, department_id]
+            )
+            return {
+                dept_id: (delta if dept_id == department_id else 0, delta)
+                for dept_id, in cursor.fetchall()
+            }
+
+    def apply_changes(self, changes: dict[int, int]) -> dict[int, tuple[int, int]]:
+        """
+        add_employees сразу для многих отделов одним UPDATE: changes - {department_id: delta}.
+        Возвращает изменения {department_id: (direct_delta, subtree_delta)} для рассылки.
+        """
+        changes = {dept_id: delta for dept_id, delta in changes.items() if delta}
+        if not changes:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH changes AS (
+                    SELECT * FROM unnest(%s::bigint[], %s::int[]) AS c(department_id, delta)
+                ),
+                shifts AS (
+                    SELECT a.id AS department_id,
+                           SUM(CASE WHEN a.id = c.department_id THEN c.delta ELSE 0 END) AS direct_delta,
+                           SUM(c.delta) AS subtree_delta
+                    FROM changes c
+                    JOIN employers_department d ON d.id = c.department_id
+                    JOIN employers_department a ON a.path @> d.path
+                    GROUP BY a.id
+                )
+                UPDATE employers_departmentstats s
+                SET direct_count = s.direct_count + shifts.direct_delta,
+                    subtree_count = s.subtree_count + shifts.subtree_delta
+                FROM shifts
+                WHERE s.department_id = shifts.department_id
+                RETURNING s.department_id, shifts.direct_delta, shifts.subtree_delta
+                """,
+                [list(changes), list(changes.values())]
+            )
+            return {dept_id: (direct, subtree) for dept_id, direct, subtree in cursor.fetchall()}
+
+    def move_subtree(self, department_id: int, old_path: str, new_path: str) -> dict[int, tuple[int, int]]:
+        """
+        Переносит численность поддерева от старых предков к новым (общие предки не меняются).
+        Возвращает изменения {department_id: (0, subtree_delta)}.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE employers_departmentstats s
+                SET subtree_count = s.subtree_count
+                    + CASE WHEN d.path @> %s::ltree THEN moved.subtree_count ELSE 0 END
+                    - CASE WHEN d.path @> %s::ltree THEN moved.subtree_count ELSE 0 END
+                FROM employers_department d,
+                     (SELECT subtree_count FROM employers_departmentstats WHERE department_id = %s) moved
+                WHERE s.department_id = d.id
+                AND d.id != %s
+                AND (d.path @> %s::ltree OR d.path @> %s::ltree)
+                RETURNING s.department_id,
+                    CASE WHEN d.path @> %s::ltree THEN moved.subtree_count ELSE 0 END
+                    - CASE WHEN d.path @> %s::ltree THEN moved.subtree_count ELSE 0 END
+                """,
+                [new_path, old_path, department_id, department_id, new_path, old_path, new_path, old_path]
+            )
+            return {dept_id: (0, delta) for dept_id, delta in cursor.fetchall() if delta}
+
+    def rebuild(self) -> None:
+        """
+        Полный пересчет одним запросом.
+        Нужен после bulk_create/QuerySet.update, которые обходят сигналы.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_DEPARTMENT_STATS_SQL)
+
+
+REBUILD_DEPARTMENT_STATS_SQL = """
+    WITH direct AS (
+        SELECT department_id, COUNT(*) AS cnt
+        FROM employers_employee
+        GROUP BY department_id
+    )
+    INSERT INTO employers_departmentstats (department_id, direct_count, subtree_count)
+    SELECT d.id,
+           COALESCE(dc.cnt, 0),
+           (
+               SELECT COALESCE(SUM(sub.cnt), 0)
+               FROM employers_department d2
+               JOIN direct sub ON sub.department_id = d2.id
+               WHERE d2.path <@ d.path
+           )
+    FROM employers_department d
+    LEFT JOIN direct dc ON dc.department_id = d.id
+    ON CONFLICT (department_id) DO UPDATE
+    SET direct_count = EXCLUDED.direct_count,
+        subtree_count = EXCLUDED.subtree_count
+"""
+
+
+class DepartmentStats(models.Model):
+    """
+    Денормализованная численность отдела: direct_count - сотрудники самого отдела,
+    subtree_count - сотрудники отдела и всех подотделов.
+    Поддерживается сигналами (см. signals.py), чтение - по первичному ключу.
+    """
+    department = models.OneToOneField(
+        Department,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="stats",
+    )
+    direct_count = models.IntegerField(default=0, verbose_name="Сотрудников в отделе")
+    subtree_count = models.IntegerField(default=0, verbose_name="Сотрудников в поддереве")
+
+    objects = DepartmentStatsManager()
+
+    class Meta:
+        verbose_name = "Численность отдела"
+        verbose_name_plural = "Численность отделов"
+
+    def __str__(self) -> str:
+        return f"{self.department_id}: {self.direct_count}/{self.subtree_count}"
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import OperationalError, connection, transaction
+from django.utils.functional import cached_property
+
+
+class CountedPage(Page):
+    PAGE_LINKS_RADIUS = 2
+
+    @cached_property
+    def nearby_page_range(self):
+        """Номера страниц вокруг текущей для ссылок - без цикла по всему page_range в шаблоне"""
+        return range(
+            max(self.number - self.PAGE_LINKS_RADIUS, 1),
+            min(self.number + self.PAGE_LINKS_RADIUS, self.paginator.num_pages) + 1,
+        )
+
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее известным итогом (из DepartmentStats) вместо COUNT(*)"""
+
+    def __init__(self, object_list, per_page, count: int | None = None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._known_count = count
+
+    @cached_property
+    def count(self):
+        if self._known_count is None:
+            return super().count
+        return self._known_count
+
+    def _get_page(self, *args, **kwargs):
+        return CountedPage(*args, **kwargs)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator для админки по большим таблицам, без точного COUNT(*) на каждую страницу.
+    Без фильтров - итог из unfiltered_count() (по умолчанию оценка pg_class.reltuples),
+    с фильтрами - точный COUNT не дольше ADMIN_COUNT_TIMEOUT_MS, иначе оценка планировщика.
+    """
+
+    def unfiltered_count(self) -> int | None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1: таблицу еще не анализировали
+        return row[0] if row and row[0] >= 0 else None
+
+    def planner_estimate(self) -> int:
+        plan = json.loads(self.object_list.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            count = self.unfiltered_count()
+            if count is not None:
+                return count
+
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s", [settings.ADMIN_COUNT_TIMEOUT_MS])
+                count = super().count
+                # Откат savepoint'а снимает и SET LOCAL: таймаут не переживет подсчет
+                transaction.set_rollback(True)
+            return count
+        except OperationalError:
+            return self.planner_estimate()
+
+
+class InvalidCursor(ValueError):
+    """Курсор не удалось декодировать"""
+
+
+def _encode_key(key: list) -> str:
+    raw = json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_key(token: str) -> list:
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(token)
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], int):
+        raise InvalidCursor(token)
+    return key
+
+
+def encode_cursor(full_name: str, pk: int) -> str:
+    """Упаковывает ключ (full_name, id) в непрозрачную строку для URL"""
+    return _encode_key([full_name, pk])
+
+
+def decode_cursor(token: str) -> tuple[str, int]:
+    full_name, pk = _decode_key(token)
+    if not isinstance(full_name, str):
+        raise InvalidCursor(token)
+    return full_name, pk
+
+
+def encode_rank_cursor(rank: float, pk: int) -> str:
+    """Курсор поисковой выдачи: ключ (rank, id)"""
+    return _encode_key([rank, pk])
+
+
+def decode_rank_cursor(token: str) -> tuple[float, int]:
+    rank, pk = _decode_key(token)
+    if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+        raise InvalidCursor(token)
+    return float(rank), pk
+
+
+def _row_key(row) -> tuple[str, int]:
+    """Ключ сортировки строки: модель или dict из .values()"""
+    if isinstance(row, dict):
+        return row["full_name"], row["id"]
+    return row.full_name, row.pk
+
+
+@dataclass
+class KeysetPage:
+    employees: list = field(default_factory=list)
+    has_next: bool = False
+    has_previous: bool = False
+
+    @property
+    def next_cursor(self) -> str | None:
+        if not self.has_next or not self.employees:
+            return None
+        return encode_cursor(*_row_key(self.employees[-1]))
+
+    @property
+    def prev_cursor(self) -> str | None:
+        if not self.has_previous or not self.employees:
+            return None
+        return encode_cursor(*_row_key(self.employees[0]))
+
+
+def keyset_paginate(queryset, per_page: int, after: str | None = None, before: str | None = None) -> KeysetPage:
+    """
+    Seek-пагинация по (full_name, id) вместо OFFSET + COUNT(*).
+    Сравнение кортежей `(full_name, id) > (%s, %s)` идет по составному B-tree индексу,
+    поэтому стоимость страницы не зависит от ее номера.
+    """
+    if before:
+        full_name, pk = decode_cursor(before)
+        rows = list(
+            queryset.extra(
+                where=["(employers_employee.full_name, employers_employee.id) < (%s, %s)"],
+                params=[full_name, pk],
+            ).order_by("-full_name", "-id")[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        # Следующая страница есть, если строка курсора (или строка после нее) еще существует
+        has_next = queryset.extra(
+            where=["(employers_employee.full_name, employers_employee.id) >= (%s, %s)"],
+            params=[full_name, pk],
+        ).exists()
+        return KeysetPage(
+            employees=list(reversed(rows[:per_page])),
+            has_next=has_next,
+            has_previous=has_previous,
+        )
+
+    if after:
+        full_name, pk = decode_cursor(after)
+        queryset = queryset.extra(
+            where=["(employers_employee.full_name, employers_employee.id) > (%s, %s)"],
+            params=[full_name, pk],
+        )
+
+    rows = list(queryset.order_by("full_name", "id")[:per_page + 1])
+    return KeysetPage(
+        employees=rows[:per_page],
+        has_next=len(rows) > per_page,
+        has_previous=bool(after),
+    )
@@ -0,0 +1,51 @@
+"""
+Чтения страниц и API дерева с реплик (org/utils/db_router.py).
+
+GET/HEAD читают с реплики. В основную БД идут только чтения клиента, который сам писал
+последние DB_REPLICA_STICKY_SECONDS (cookie из StickyPrimaryMiddleware): так он видит свои
+изменения, а чужая запись не снимает с реплик весь трафик. Админка и запись сюда не
+попадают и всегда идут в основную БД. Общие значения на версию дерева (снимок, аналитика,
+кешируемые страницы сотрудников) строятся по основной БД (tree_cache._build, use_primary):
+из кеша их читает и пишущий код.
+
+Пока реплика может отставать от последней записи (may_lag), ответ с нее помечается
+request.replica_may_lag: conditional.py не выдает ему ETag новой версии дерева, иначе
+браузер и nginx хранили бы под ним старые данные.
+"""
+from __future__ import annotations
+
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+from org.utils.db_router import may_lag, use_replica, wrote_recently
+
+from .conditional import SAFE_METHODS
+from .tree_cache import aget_tree_validators, get_tree_validators
+
+
+def read_from_replica(view):
+    """Чтения view - с реплики, если она есть и клиент сам только что не писал (для sync и async view)"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_inner(request, *args, **kwargs):
+            if not settings.DB_REPLICAS or request.method not in SAFE_METHODS or wrote_recently(request):
+                return await view(request, *args, **kwargs)
+            validators = getattr(request, 'tree_validators', None) or await aget_tree_validators()
+            request.replica_may_lag = may_lag(validators[1])
+            with use_replica():
+                return await view(request, *args, **kwargs)
+
+        return async_inner
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not settings.DB_REPLICAS or request.method not in SAFE_METHODS or wrote_recently(request):
+            return view(request, *args, **kwargs)
+        validators = getattr(request, 'tree_validators', None) or get_tree_validators()
+        request.replica_may_lag = may_lag(validators[1])
+        with use_replica():
+            return view(request, *args, **kwargs)
+
+    return inner
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import HeadcountConsumer
+
+websocket_urlpatterns = [
+    path('ws/headcount/', HeadcountConsumer.as_asgi()),
+]
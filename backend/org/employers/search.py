@@ -0,0 +1,81 @@
+"""
+Ранжированный поиск сотрудников по ФИО / должности.
+
+Кандидаты - строки, где query похож на слово из full_name или position
+(`UPPER(col) %> query`: word_similarity выше pg_trgm.word_similarity_threshold), их находят
+GIN-индексы pg_trgm на UPPER(full_name) / UPPER(position) (см. Employee.Meta.indexes).
+Порядок выдачи - word_similarity по убыванию, страницы - seek по ключу (rank, id).
+
+Похожесть считается на каждого кандидата, поэтому их не больше MAX_CANDIDATES: при более
+широком запросе ранжируются первые найденные индексом, и запрос стоит уточнить. Оценка
+селективности `%>` грубая, и под LIMIT планировщик выбирает seq scan с word_similarity на
+каждую строку таблицы - поэтому запрос идет с SET LOCAL enable_seqscan = off.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from org.utils.db_router import read_alias, read_connection
+
+from .pagination import decode_rank_cursor, encode_rank_cursor
+
+# Короче трех символов в строке нет ни одной триграммы - индекс не поможет
+MIN_QUERY_LENGTH = 3
+MAX_CANDIDATES = 1000
+SEARCH_FIELDS = ('id', 'full_name', 'position', 'department_id', 'rank')
+
+# rank - float8: значение из курсора сравнивается с ним без потери точности float4
+SEARCH_SQL = """
+    SELECT id, full_name, position, department_id, rank
+    FROM (
+        SELECT id, full_name, position, department_id,
+               greatest(word_similarity(%s, full_name), word_similarity(%s, position))::float8 AS rank
+        FROM employers_employee
+        WHERE (UPPER(full_name) %%> %s OR UPPER(position) %%> %s) {subtree}
+        LIMIT %s
+    ) candidates
+    {after}
+    ORDER BY rank DESC, id
+    LIMIT %s
+"""
+
+
+@dataclass
+class SearchPage:
+    results: list = field(default_factory=list)
+    has_next: bool = False
+
+    @property
+    def next_cursor(self) -> str | None:
+        if not self.has_next or not self.results:
+            return None
+        last = self.results[-1]
+        return encode_rank_cursor(last['rank'], last['id'])
+
+
+def search_employees(query: str, dept_path: str | None = None, per_page: int = 20,
+                     after: str | None = None) -> SearchPage:
+    """
+    Сотрудники, похожие на query по full_name или position (самые похожие первыми),
+    опционально внутри поддерева dept_path. after - курсор из SearchPage.next_cursor.
+    """
+    params = [query, query, query, query]
+    subtree = ""
+    if dept_path is not None:
+        subtree = "AND structure_path <@ %s::ltree"
+        params.append(dept_path)
+    params.append(MAX_CANDIDATES)
+    after_sql = ""
+    if after:
+        rank, pk = decode_rank_cursor(after)
+        after_sql = "WHERE rank < %s OR (rank = %s AND id > %s)"
+        params.extend([rank, rank, pk])
+    params.append(per_page + 1)
+
+    with transaction.atomic(using=read_alias()), read_connection().cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(SEARCH_SQL.format(subtree=subtree, after=after_sql), params)
+        rows = [dict(zip(SEARCH_FIELDS, row)) for row in cursor.fetchall()]
+    return SearchPage(results=rows[:per_page], has_next=len(rows) > per_page)
@@ -1,44 +1,64 @@
 from __future__ import annotations
 
-from django.db import connection
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from org.employers.models import Department
+from org.employers.employee_pages import invalidate_pages
+from org.employers.headcount import merge_deltas, publish_headcount
+from org.employers.models import Department, DepartmentStats, Employee
+from org.employers.tree_cache import bump_tree_version
+from org.employers.tree_index import mark_dirty
 
 
 @receiver(post_save, sender=Department)
-def update_employees_structure_path(sender, instance, **kwargs):
+def create_department_stats(sender, instance, created, **kwargs):
+    """Новый отдел пуст - заводим ему нулевую строку численности"""
+    if created:
+        DepartmentStats.objects.get_or_create(department_id=instance.pk)
+
+
+@receiver(post_save, sender=Employee)
+def update_stats_on_employee_save(sender, instance, created, **kwargs):
+    """Прием сотрудника или перевод в другой отдел"""
+    old_department_id = getattr(instance, "_loaded_department_id", None)
+
+    if created:
+        publish_headcount(DepartmentStats.objects.add_employees(instance.department_id, 1))
+    elif old_department_id and old_department_id != instance.department_id:
+        deltas = merge_deltas({}, DepartmentStats.objects.add_employees(old_department_id, -1))
+        merge_deltas(deltas, DepartmentStats.objects.add_employees(instance.department_id, 1))
+        publish_headcount(deltas)
+
+    # Страницы сотрудников старого и нового отдела (и их предков) - после коммита
+    changed = {instance.department_id, old_department_id} - {None}
+    transaction.on_commit(partial(invalidate_pages, changed))
+    instance._loaded_department_id = instance.department_id
+
+
+@receiver(post_delete, sender=Employee)
+def update_stats_on_employee_delete(sender, instance, **kwargs):
+    publish_headcount(DepartmentStats.objects.add_employees(instance.department_id, -1))
+    transaction.on_commit(partial(invalidate_pages, [instance.department_id]))
+
+
+@receiver([post_save, post_delete], sender=Employee)
+def invalidate_department_tree(sender, **kwargs):
+    """Новая версия снимка дерева - после коммита, чтобы перестроение увидело изменения"""
+    transaction.on_commit(bump_tree_version)
+
+
+@receiver([post_save, post_delete], sender=Department)
+def invalidate_department_structure(sender, **kwargs):
     """
-    Обновляет structure_path у всех сотрудников отдела при изменении path отдела
+    Изменение отдела - новая версия и снимка, и структуры: индекс дерева перестроится, а
+    кешированные страницы сотрудников всех отделов сменят ключ (employee_pages.page_key)
     """
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "SELECT path::text FROM employers_department WHERE id = %s",
-            [instance.pk]
-        )
-        row = cursor.fetchone()
-        if row and row[0]:
-            new_path = row[0]
-
-            # Обновляем structure_path у всех сотрудников этого отдела и поддерева
-            # Используем ltree операторы для поиска всех подотделов
-            with connection.cursor() as update_cursor:
-                update_cursor.execute(
-                    """
-                    UPDATE employers_employee
-                    SET structure_path = %s::ltree
-                    WHERE department_id = %s
-                    """,
-                    [new_path, instance.pk]
-                )
-                update_cursor.execute(
-                    """
-                    UPDATE employers_employee e
-                    SET structure_path = %s::ltree
-                    FROM employers_department d
-                    WHERE e.department_id = d.id
-                    AND d.path <@ %s::ltree
-                    AND d.id != %s
-                    """,
-                    [new_path, new_path, instance.pk]
-                )
+    transaction.on_commit(partial(bump_tree_version, structure=True))
+
+
+@receiver([post_save, post_delete], sender=Department)
+def mark_tree_index_dirty(sender, **kwargs):
+    """До коммита индекс дерева в памяти не видит изменение отдела - эта транзакция читает из БД"""
+    mark_dirty()
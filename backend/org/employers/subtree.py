@@ -0,0 +1,181 @@
+"""
+Сотрудники поддерева по full_name без сортировки всего поддерева.
+
+`structure_path <@ X ORDER BY full_name` находит строки по GiST, но порядок не знает -
+Postgres сортирует все поддерево ради одной страницы. Вместо этого каждая ветка
+(отдел поддерева) читается по B-tree индексу (structure_path, full_name, id) уже в нужном
+порядке и с LIMIT страницы, а ветки сливаются через UNION ALL ... ORDER BY ... LIMIT:
+страница стоит O(N * число отделов), а не сортировку всего поддерева.
+"""
+from __future__ import annotations
+
+from org.utils.db_router import read_connection
+
+from .pagination import KeysetPage, decode_cursor
+from .tree_index import get_tree_index
+
+# Все отделы поддерева - ветки слияния. Пустые не отбрасываются по DepartmentStats: при
+# расхождении счетчиков с данными из страницы пропали бы сотрудники, а пустая ветка стоит
+# одного пустого чтения индекса
+BRANCH_PATHS_SQL = """
+    SELECT path::text AS path FROM employers_department WHERE path <@ %s::ltree
+"""
+
+BRANCH_PATHS_MANY_SQL = """
+    SELECT path::text AS path FROM employers_department WHERE path <@ ANY(%s::ltree[])
+"""
+
+EMPLOYEE_FIELDS = ('id', 'full_name', 'position', 'hired_at', 'salary', 'department_id')
+
+# Больше веток - запрос становится дороже в планировании, чем обычная сортировка
+MAX_BRANCHES = 500
+# Для постраничного режима: больше строк (OFFSET + страница) * ветки - дешевле отсортировать
+MAX_MERGE_ROWS = 50_000
+# window_query читает ветки целиком до LIMIT и сортирует (в отличие от ленивого Merge Append
+# в merge_query), поэтому в него идут только неглубокие страницы
+MAX_WINDOW_ROWS = 2_000
+
+
+def can_merge(branch_count: int, rows_per_branch: int) -> bool:
+    return branch_count <= MAX_BRANCHES and branch_count * rows_per_branch <= MAX_MERGE_ROWS
+
+
+def can_window(branch_count: int, rows_per_branch: int) -> bool:
+    return branch_count * rows_per_branch <= MAX_WINDOW_ROWS
+
+
+def merge_query(branch_paths, columns, limit: int, offset: int = 0,
+                after: tuple | None = None, before: tuple | None = None) -> tuple[str, list]:
+    """
+    SQL слияния веток по (full_name, id). after/before - ключ курсора (full_name, id);
+    с before строки идут в обратном порядке (страница перед курсором).
+    """
+    descending = before is not None
+    order = "full_name DESC, id DESC" if descending else "full_name, id"
+    key = before if descending else after
+    condition = ""
+    if key is not None:
+        condition = f" AND (full_name, id) {'<' if descending else '>'} (%s, %s)"
+
+    select = ", ".join(columns)
+    if not branch_paths:
+        return f"SELECT {select} FROM employers_employee WHERE false", []
+
+    branches = []
+    params = []
+    for path in branch_paths:
+        branches.append(
+            f"(SELECT {select} FROM employers_employee "
+            f"WHERE structure_path = %s::ltree{condition} ORDER BY {order} LIMIT %s)"
+        )
+        params.append(path)
+        if key is not None:
+            params.extend(key)
+        params.append(limit + offset)
+
+    sql = f"SELECT * FROM ({' UNION ALL '.join(branches)}) AS merged ORDER BY {order} LIMIT %s OFFSET %s"
+    return sql, [*params, limit, offset]
+
+
+# Страницы нескольких отделов одним запросом: ветки всех страниц - строки VALUES, каждая
+# читается по B-tree индексу через LATERAL, а ROW_NUMBER() по номеру страницы сливает ее ветки
+WINDOW_SQL = """
+    SELECT ranked.*
+    FROM (
+        SELECT r.batch, r.skip, r.take, page.*,
+               ROW_NUMBER() OVER (PARTITION BY r.batch ORDER BY page.full_name, page.id) AS rn
+        FROM (VALUES {values}) AS r(batch, path, after_name, after_id, skip, take)
+        CROSS JOIN LATERAL (
+            SELECT {select} FROM employers_employee
+            WHERE structure_path = r.path AND (full_name, id) > (r.after_name, r.after_id)
+            ORDER BY full_name, id
+            LIMIT r.skip + r.take
+        ) AS page
+    ) AS ranked
+    WHERE rn > skip AND rn <= skip + take
+    ORDER BY batch, rn
+"""
+WINDOW_ROW = "(%s::int, %s::ltree, %s::varchar, %s::bigint, %s::int, %s::int)"
+
+
+def window_query(batches, columns) -> tuple[str, list]:
+    """
+    SQL страниц нескольких отделов; batches - (ветки, limit, offset, after) на страницу.
+    Строки результата помечены batch - номером страницы в batches.
+    """
+    columns = list(dict.fromkeys([*columns, "id", "full_name"]))
+    rows = []
+    params = []
+    for batch, (branch_paths, limit, offset, after) in enumerate(batches):
+        # Пустая строка и id 0 - меньше любого ключа: условие курсора всегда в индексе
+        after_name, after_id = after if after is not None else ("", 0)
+        for path in branch_paths:
+            rows.append(WINDOW_ROW)
+            params.extend([batch, path, after_name, after_id, offset, limit])
+
+    if not rows:
+        return f"SELECT NULL::int AS batch, {', '.join(columns)} FROM employers_employee WHERE false", []
+    return WINDOW_SQL.format(values=", ".join(rows), select=", ".join(columns)), params
+
+
+def get_branch_paths(dept_path: str, department_id: int | None = None) -> list[str]:
+    """Пути отделов поддерева: из индекса дерева в памяти, если ему можно верить"""
+    index = get_tree_index() if department_id is not None else None
+    if index is not None and department_id in index:
+        return index.branch_paths(department_id)
+
+    with read_connection().cursor() as cursor:
+        cursor.execute(BRANCH_PATHS_SQL, [dept_path])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_branch_paths_many(departments) -> dict[int, list[str]]:
+    """get_branch_paths для нескольких отделов: без индекса дерева - одним запросом"""
+    index = get_tree_index()
+    if index is not None and all(department["id"] in index for department in departments):
+        return {department["id"]: index.branch_paths(department["id"]) for department in departments}
+    if not departments:
+        return {}
+
+    with read_connection().cursor() as cursor:
+        cursor.execute(BRANCH_PATHS_MANY_SQL, [[department["path"] for department in departments]])
+        paths = [row[0] for row in cursor.fetchall()]
+    return {
+        department["id"]: [
+            path for path in paths
+            if path == department["path"] or path.startswith(department["path"] + ".")
+        ]
+        for department in departments
+    }
+
+
+def fetch_rows(sql: str, params) -> list[dict]:
+    with read_connection().cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def keyset_page(branch_paths, columns, per_page: int, after: str | None = None,
+                before: str | None = None) -> KeysetPage:
+    """То же, что pagination.keyset_paginate по поддереву, но слиянием веток"""
+    columns = list(dict.fromkeys([*columns, "id", "full_name"]))
+
+    if before:
+        full_name, pk = decode_cursor(before)
+        rows = fetch_rows(*merge_query(branch_paths, columns, per_page + 1, before=(full_name, pk)))
+        # (full_name, id) > (курсор, id - 1) - строка курсора или после нее: есть следующая страница
+        tail = fetch_rows(*merge_query(branch_paths, ["id", "full_name"], 1, after=(full_name, pk - 1)))
+        return KeysetPage(
+            employees=list(reversed(rows[:per_page])),
+            has_next=bool(tail),
+            has_previous=len(rows) > per_page,
+        )
+
+    key = decode_cursor(after) if after else None
+    rows = fetch_rows(*merge_query(branch_paths, columns, per_page + 1, after=key))
+    return KeysetPage(
+        employees=rows[:per_page],
+        has_next=len(rows) > per_page,
+        has_previous=bool(after),
+    )
@@ -0,0 +1,258 @@
+"""
+Версионируемый кеш структуры отделов.
+
+Снимок дерева - компактные dict'ы (без pickle моделей), лежит под ключом с номером версии.
+Сигналы Department/Employee увеличивают версию, старые снимки просто перестают читаться.
+Перестроение single-flight: снимок строит один воркер (lock в Redis), остальные отдают
+последний построенный снимок. Перед Redis стоит опциональный кеш в памяти процесса.
+Тем же механизмом (get_versioned) кешируются другие производные дерева, например аналитика.
+Для async-views те же операции есть в неблокирующем варианте (a*-функции).
+"""
+from __future__ import annotations
+
+import time
+
+import structlog
+from django.conf import settings
+from django.core.cache import cache
+
+from org.utils import async_cache, db_router
+from org.utils.async_db import fetch_all
+
+from .models import Department
+
+logger = structlog.get_logger(__name__)
+
+VERSION_KEY = "department_tree:version"
+# Версия структуры (состав отделов, path, parent_id): растет только при изменении отделов,
+# а не на каждое изменение сотрудника - по ней живет индекс дерева (tree_index.py)
+STRUCTURE_VERSION_KEY = "department_tree:structure_version"
+# Время последнего изменения дерева (unix-время) - для Last-Modified и уникальности ETag
+MODIFIED_KEY = "department_tree:modified"
+SNAPSHOT = "department_tree:snapshot"
+LATEST_KEY = f"{SNAPSHOT}:latest"
+LOCK_KEY = f"{SNAPSHOT}:rebuild_lock"
+LOCK_TIMEOUT = 30
+
+# name -> (version, value): последние значения, прочитанные этим процессом
+_local_values: dict[str, tuple[int, object]] = {}
+
+
+def snapshot_key(version: int) -> str:
+    return f"{SNAPSHOT}:{version}"
+
+
+def get_tree_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def get_structure_version() -> int:
+    version = cache.get(STRUCTURE_VERSION_KEY)
+    if version is None:
+        cache.add(STRUCTURE_VERSION_KEY, 1, timeout=None)
+        version = cache.get(STRUCTURE_VERSION_KEY, 1)
+    return version
+
+
+def bump_tree_version(structure: bool = False) -> None:
+    """structure=True - изменились сами отделы, а не только сотрудники"""
+    # Структура - раньше версии дерева: снимок новой версии прочитает уже новую структуру
+    keys = [STRUCTURE_VERSION_KEY, VERSION_KEY] if structure else [VERSION_KEY]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+    cache.set(MODIFIED_KEY, int(time.time()), timeout=None)
+
+
+def get_tree_validators() -> tuple[int, int]:
+    """(версия, время изменения) дерева одним запросом к кешу - для ETag / Last-Modified"""
+    values = cache.get_many([VERSION_KEY, MODIFIED_KEY])
+    if VERSION_KEY not in values:
+        values[VERSION_KEY] = get_tree_version()
+    if MODIFIED_KEY not in values:
+        # Кеш очищен: новое время, чтобы ETag не совпал с выданными до очистки
+        cache.add(MODIFIED_KEY, int(time.time()), timeout=None)
+        values[MODIFIED_KEY] = cache.get(MODIFIED_KEY, int(time.time()))
+    return values[VERSION_KEY], values[MODIFIED_KEY]
+
+
+# То же, что Department.objects.with_tree_info(), для асинхронного построения снимка
+SNAPSHOT_SQL = """
+    SELECT d.id, d.name, d.parent_id, d.level, d.path::text AS path,
+           COALESCE(s.direct_count, 0) AS employees_count,
+           COALESCE(s.subtree_count, 0) AS subtree_count,
+           EXISTS (SELECT 1 FROM employers_department c WHERE c.parent_id = d.id) AS has_children
+    FROM employers_department d
+    LEFT JOIN employers_departmentstats s ON s.department_id = d.id
+    ORDER BY d.path
+"""
+
+
+def build_snapshot(version: int) -> dict:
+    """Одним запросом собирает все отделы с численностью и связями родитель-потомки"""
+    # Версия структуры читается до запроса: снимок не может оказаться старее своей метки
+    structure_version = get_structure_version()
+    departments = list(Department.objects.with_tree_info().order_by("path").values(
+        "id", "name", "parent_id", "level", "path", "employees_count", "subtree_count", "has_children"
+    ))
+    for dept in departments:
+        dept["path"] = ".".join(dept["path"])
+    return _assemble_snapshot(version, structure_version, departments)
+
+
+async def abuild_snapshot(version: int) -> dict:
+    structure_version = await aget_structure_version()
+    return _assemble_snapshot(version, structure_version, await fetch_all(SNAPSHOT_SQL))
+
+
+def _assemble_snapshot(version: int, structure_version: int, departments) -> dict:
+    nodes = {}
+    children = {}
+    roots = []
+    for dept in departments:
+        nodes[dept["id"]] = dept
+        if dept["parent_id"] is None:
+            roots.append(dept["id"])
+        else:
+            children.setdefault(dept["parent_id"], []).append(dept["id"])
+
+    return {
+        "version": version,
+        "structure_version": structure_version,
+        "nodes": nodes,
+        "children": children,
+        "roots": roots,
+    }
+
+
+def _build(build, version: int):
+    """
+    Общие значения строятся только по основной БД: они живут всю версию и попадают в код,
+    который пишет (например, индекс дерева), а реплика может отставать дольше
+    DB_REPLICA_STICKY_SECONDS. Перестроение - раз на версию, основную БД это почти не нагружает.
+    """
+    with db_router.use_primary():
+        return build(version)
+
+
+async def _abuild_snapshot(version: int) -> dict:
+    with db_router.use_primary():
+        return await abuild_snapshot(version)
+
+
+def get_versioned(name: str, build):
+    """
+    Значение build(version) для текущей версии дерева: из памяти процесса, из Redis
+    под ключом `name:version` или построенное одним воркером под lock'ом.
+    """
+    version = get_tree_version()
+    use_local = settings.DEPARTMENT_TREE_LOCAL_CACHE
+
+    local = _local_values.get(name)
+    if use_local and local and local[0] == version:
+        return local[1]
+
+    value = cache.get(f"{name}:{version}")
+    if value is None:
+        lock_key = f"{name}:rebuild_lock"
+        if cache.add(lock_key, version, timeout=LOCK_TIMEOUT):
+            try:
+                value = _build(build, version)
+                cache.set(f"{name}:{version}", value, settings.DEPARTMENT_TREE_CACHE_TTL)
+                cache.set(f"{name}:latest", value, timeout=None)
+                logger.info("tree_cache_rebuilt", name=name, version=version)
+            finally:
+                cache.delete(lock_key)
+        else:
+            # Значение уже строит другой воркер - отдаем предыдущее, пусть и устаревшее
+            value = cache.get(f"{name}:latest")
+            if value is None:
+                return _build(build, version)
+            return value
+
+    if use_local:
+        _local_values[name] = (version, value)
+    return value
+
+
+def get_tree_snapshot() -> dict:
+    return get_versioned(SNAPSHOT, build_snapshot)
+
+
+async def aget_tree_version() -> int:
+    version = await async_cache.aget(VERSION_KEY)
+    if version is None:
+        await async_cache.aadd(VERSION_KEY, 1, timeout=None)
+        version = await async_cache.aget(VERSION_KEY, 1)
+    return version
+
+
+async def aget_structure_version() -> int:
+    version = await async_cache.aget(STRUCTURE_VERSION_KEY)
+    if version is None:
+        await async_cache.aadd(STRUCTURE_VERSION_KEY, 1, timeout=None)
+        version = await async_cache.aget(STRUCTURE_VERSION_KEY, 1)
+    return version
+
+
+async def aget_tree_validators() -> tuple[int, int]:
+    version = await aget_tree_version()
+    modified = await async_cache.aget(MODIFIED_KEY)
+    if modified is None:
+        await async_cache.aadd(MODIFIED_KEY, int(time.time()), timeout=None)
+        modified = await async_cache.aget(MODIFIED_KEY, int(time.time()))
+    return version, modified
+
+
+async def aget_tree_snapshot() -> dict:
+    """Неблокирующий вариант get_tree_snapshot для async-views"""
+    version = await aget_tree_version()
+    use_local = settings.DEPARTMENT_TREE_LOCAL_CACHE
+
+    local = _local_values.get(SNAPSHOT)
+    if use_local and local and local[0] == version:
+        return local[1]
+
+    snapshot = await async_cache.aget(snapshot_key(version))
+    if snapshot is None:
+        if await async_cache.aadd(LOCK_KEY, version, timeout=LOCK_TIMEOUT):
+            try:
+                snapshot = await _abuild_snapshot(version)
+                await async_cache.aset(snapshot_key(version), snapshot, settings.DEPARTMENT_TREE_CACHE_TTL)
+                await async_cache.aset(LATEST_KEY, snapshot, timeout=None)
+                logger.info("tree_cache_rebuilt", name=SNAPSHOT, version=version)
+            finally:
+                await async_cache.adelete(LOCK_KEY)
+        else:
+            snapshot = await async_cache.aget(LATEST_KEY)
+            if snapshot is None:
+                return await _abuild_snapshot(version)
+            return snapshot
+
+    if use_local:
+        _local_values[SNAPSHOT] = (version, snapshot)
+    return snapshot
+
+
+def get_root_departments() -> list[dict]:
+    snapshot = get_tree_snapshot()
+    return [snapshot["nodes"][dept_id] for dept_id in snapshot["roots"]]
+
+
+def get_child_departments(department_id: int) -> list[dict] | None:
+    """Дочерние отделы из снимка; None - такого отдела нет"""
+    snapshot = get_tree_snapshot()
+    if department_id not in snapshot["nodes"]:
+        return None
+    return [snapshot["nodes"][dept_id] for dept_id in snapshot["children"].get(department_id, [])]
+
+
+async def aget_root_departments() -> list[dict]:
+    snapshot = await aget_tree_snapshot()
+    return [snapshot["nodes"][dept_id] for dept_id in snapshot["roots"]]
@@ -0,0 +1,184 @@
+"""
+Неизменяемый индекс дерева отделов в памяти процесса.
+
+Строится из снимка tree_cache и пересоздается только при смене версии структуры
+(изменение отделов): прием, перевод и увольнение сотрудников меняют лишь численность, и
+тогда индекс берет узлы нового снимка без повторного обхода. Индекс отдает путь, предков, потомков и
+множество id поддерева без запросов к БД. Прямой (pre-order) обход нумерует отделы так,
+что поддерево - это отрезок [pre, last] в order.
+
+get_tree_index() возвращает None, если индексу нельзя верить, и тогда вызывающий код
+идет в БД. Так бывает сразу после изменения отделов, пока снимок новой структуры строит
+другой воркер (пока меняется только численность, отдается последний снимок). Так же бывает
+внутри транзакции, которая сама меняла отделы: версия поднимается только после коммита.
+
+Индекс - только для чтения. Запись (Employee.save, DepartmentStats.add_employees) берет путь
+и предков отдела из БД внутри самого INSERT/UPDATE: перенос отдела другим воркером индекс
+видит лишь после коммита, и данные с устаревшим путем остались бы неверными навсегда.
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, replace
+
+from django.db import connection
+
+from .models import Department
+from .tree_cache import aget_structure_version, aget_tree_snapshot, get_structure_version, get_tree_snapshot
+
+NODE_FIELDS = ("id", "name", "parent_id", "level", "path", "employees_count", "subtree_count", "has_children")
+
+
+@dataclass(frozen=True)
+class TreeIndex:
+    # Версия снимка, из которого взяты узлы, и версия структуры, по которой построен обход
+    version: int
+    structure_version: int
+    # Узлы снимка: id, name, parent_id, level, path (строкой), employees_count, subtree_count, has_children
+    nodes: dict[int, dict]
+    children: dict[int, tuple[int, ...]]
+    # Предки от корня до родителя
+    ancestors: dict[int, tuple[int, ...]]
+    # Отделы в прямом обходе; поддерево отдела - order[pre[id]:last[id] + 1]
+    order: tuple[int, ...]
+    pre: dict[int, int]
+    last: dict[int, int]
+    subtree: dict[int, frozenset[int]]
+
+    def __contains__(self, department_id: int) -> bool:
+        return department_id in self.nodes
+
+    def path(self, department_id: int) -> str:
+        return self.nodes[department_id]["path"]
+
+    def lineage(self, department_id: int) -> tuple[int, ...]:
+        """Предки и сам отдел - строки DepartmentStats, которые меняет прием сотрудника"""
+        return (*self.ancestors[department_id], department_id)
+
+    def descendants(self, department_id: int) -> tuple[int, ...]:
+        """Поддерево в прямом обходе, начиная с самого отдела"""
+        return self.order[self.pre[department_id]:self.last[department_id] + 1]
+
+    def branch_paths(self, department_id: int) -> list[str]:
+        """Пути всех отделов поддерева - ветки слияния в subtree.py (без отсева по счетчикам)"""
+        return [self.path(dept_id) for dept_id in self.descendants(department_id)]
+
+    def is_descendant(self, department_id: int, ancestor_id: int) -> bool:
+        return self.pre[ancestor_id] <= self.pre[department_id] <= self.last[ancestor_id]
+
+
+def build_index(snapshot: dict) -> TreeIndex:
+    nodes = snapshot["nodes"]
+    children = {dept_id: tuple(ids) for dept_id, ids in snapshot["children"].items()}
+
+    order = []
+    pre = {}
+    last = {}
+    ancestors = {}
+    # Итеративный обход: (id, предки, True - выход из поддерева)
+    stack = [(root_id, (), False) for root_id in reversed(snapshot["roots"])]
+    while stack:
+        dept_id, parents, leaving = stack.pop()
+        if leaving:
+            last[dept_id] = len(order) - 1
+            continue
+        pre[dept_id] = len(order)
+        order.append(dept_id)
+        ancestors[dept_id] = parents
+        stack.append((dept_id, parents, True))
+        for child_id in reversed(children.get(dept_id, ())):
+            stack.append((child_id, (*parents, dept_id), False))
+
+    order = tuple(order)
+    subtree = {dept_id: frozenset(order[pre[dept_id]:last[dept_id] + 1]) for dept_id in order}
+    return TreeIndex(
+        version=snapshot["version"],
+        structure_version=snapshot["structure_version"],
+        nodes=nodes,
+        children=children,
+        ancestors=ancestors,
+        order=order,
+        pre=pre,
+        last=last,
+        subtree=subtree,
+    )
+
+
+_index: TreeIndex | None = None
+_state = threading.local()
+
+
+def mark_dirty() -> None:
+    """Текущая транзакция меняет отделы: до ее конца индекс для нее устарел"""
+    _state.dirty = True
+
+
+def _is_fresh() -> bool:
+    if not connection.in_atomic_block:
+        _state.dirty = False
+        return True
+    return not getattr(_state, "dirty", False)
+
+
+def get_tree_index() -> TreeIndex | None:
+    """Индекс текущей структуры дерева; None - индексу сейчас нельзя верить, читать из БД"""
+    if not _is_fresh():
+        return None
+    return _index_for(get_structure_version(), get_tree_snapshot())
+
+
+async def aget_tree_index() -> TreeIndex | None:
+    """get_tree_index для async-views (они не пишут, проверка транзакции не нужна)"""
+    return _index_for(await aget_structure_version(), await aget_tree_snapshot())
+
+
+def _index_for(structure_version: int, snapshot: dict) -> TreeIndex | None:
+    global _index
+
+    if snapshot.get("structure_version") != structure_version:
+        # Отдан снимок прошлой структуры, пока текущий строит другой воркер
+        return None
+    index = _index
+    if index is None or index.structure_version != structure_version:
+        index = build_index(snapshot)
+    elif index.version != snapshot["version"]:
+        # Изменилась только численность: обход дерева тот же, узлы - из нового снимка
+        index = replace(index, version=snapshot["version"], nodes=snapshot["nodes"])
+    _index = index
+    return index
+
+
+def get_department(department_id: int) -> dict | None:
+    """Отдел (dict с полями NODE_FIELDS) из индекса, а если индексу нельзя верить - из БД"""
+    index = get_tree_index()
+    if index is not None:
+        return index.nodes.get(department_id)
+
+    department = Department.objects.with_tree_info().filter(pk=department_id).values(*NODE_FIELDS).first()
+    if department is not None:
+        department["path"] = ".".join(department["path"])
+    return department
+
+
+def get_departments(department_ids) -> dict[int, dict]:
+    """get_department для нескольких отделов: без индекса - одним запросом; ненайденных нет в ответе"""
+    index = get_tree_index()
+    if index is not None:
+        return {dept_id: index.nodes[dept_id] for dept_id in department_ids if dept_id in index}
+
+    departments = Department.objects.with_tree_info().filter(pk__in=department_ids).values(*NODE_FIELDS)
+    result = {}
+    for department in departments:
+        department["path"] = ".".join(department["path"])
+        result[department["id"]] = department
+    return result
+
+
+def get_department_path(department_id: int) -> str | None:
+    index = get_tree_index()
+    if index is not None and department_id in index:
+        return index.path(department_id)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT path::text FROM employers_department WHERE id = %s", [department_id])
+        row = cursor.fetchone()
+    return row[0] if row else None
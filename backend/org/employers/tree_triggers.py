@@ -0,0 +1,153 @@
+"""
+Триггеры PostgreSQL, которые считают path/level отделов и structure_path сотрудников
+(режим DEPARTMENT_TREE_TRIGGERS). Ставятся и снимаются командой tree_triggers, а не
+миграцией: режим переключается на живой базе без отката миграций. Проверка
+check_tree_triggers (`manage.py check --database default`, migrate) предупреждает,
+если триггеры в базе не совпадают с настройкой.
+"""
+from __future__ import annotations
+
+from django.conf import settings
+from django.core import checks
+from django.db import DatabaseError, connection
+
+INSTALL_SQL = """
+CREATE OR REPLACE FUNCTION employers_department_set_path() RETURNS trigger AS $$
+DECLARE
+    parent_path ltree;
+BEGIN
+    IF NEW.parent_id IS NULL THEN
+        NEW.path := NEW.id::text::ltree;
+    ELSE
+        SELECT path INTO parent_path FROM employers_department WHERE id = NEW.parent_id;
+        IF TG_OP = 'UPDATE' AND parent_path <@ OLD.path THEN
+            RAISE EXCEPTION 'department % cannot be moved into its own subtree', NEW.id;
+        END IF;
+        NEW.path := parent_path || NEW.id::text;
+    END IF;
+    NEW.level := nlevel(NEW.path);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION employers_department_move_subtree() RETURNS trigger AS $$
+BEGIN
+    UPDATE employers_department
+    SET path = NEW.path || subpath(path, nlevel(OLD.path)),
+        level = nlevel(NEW.path) + nlevel(path) - nlevel(OLD.path)
+    WHERE path <@ OLD.path AND id != NEW.id;
+
+    UPDATE employers_employee e
+    SET structure_path = d.path
+    FROM employers_department d
+    WHERE e.department_id = d.id
+    AND d.path <@ NEW.path
+    AND e.structure_path IS DISTINCT FROM d.path;
+
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION employers_employee_set_structure_path() RETURNS trigger AS $$
+BEGIN
+    SELECT path INTO NEW.structure_path FROM employers_department WHERE id = NEW.department_id;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER employers_department_set_path_insert
+    BEFORE INSERT ON employers_department
+    FOR EACH ROW EXECUTE FUNCTION employers_department_set_path();
+
+-- Только смена parent_id: пути потомков переписывает move_subtree одним UPDATE,
+-- пересчет их по родителю внутри того же UPDATE зависел бы от порядка строк
+CREATE TRIGGER employers_department_set_path_update
+    BEFORE UPDATE OF parent_id ON employers_department
+    FOR EACH ROW
+    WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+    EXECUTE FUNCTION employers_department_set_path();
+
+CREATE TRIGGER employers_department_move_subtree
+    AFTER UPDATE OF parent_id ON employers_department
+    FOR EACH ROW
+    WHEN (OLD.path IS DISTINCT FROM NEW.path)
+    EXECUTE FUNCTION employers_department_move_subtree();
+
+CREATE TRIGGER employers_employee_set_structure_path_insert
+    BEFORE INSERT ON employers_employee
+    FOR EACH ROW EXECUTE FUNCTION employers_employee_set_structure_path();
+
+CREATE TRIGGER employers_employee_set_structure_path_update
+    BEFORE UPDATE OF department_id, structure_path ON employers_employee
+    FOR EACH ROW
+    WHEN (OLD.department_id IS DISTINCT FROM NEW.department_id
+          OR OLD.structure_path IS DISTINCT FROM NEW.structure_path)
+    EXECUTE FUNCTION employers_employee_set_structure_path();
+"""
+
+DROP_SQL = """
+DROP TRIGGER IF EXISTS employers_department_set_path_insert ON employers_department;
+DROP TRIGGER IF EXISTS employers_department_set_path_update ON employers_department;
+DROP TRIGGER IF EXISTS employers_department_move_subtree ON employers_department;
+DROP TRIGGER IF EXISTS employers_employee_set_structure_path_insert ON employers_employee;
+DROP TRIGGER IF EXISTS employers_employee_set_structure_path_update ON employers_employee;
+DROP FUNCTION IF EXISTS employers_department_set_path();
+DROP FUNCTION IF EXISTS employers_department_move_subtree();
+DROP FUNCTION IF EXISTS employers_employee_set_structure_path();
+"""
+
+TRIGGERS = (
+    "employers_department_set_path_insert",
+    "employers_department_set_path_update",
+    "employers_department_move_subtree",
+    "employers_employee_set_structure_path_insert",
+    "employers_employee_set_structure_path_update",
+)
+
+
+def installed_triggers() -> set[str]:
+    """Имена триггеров TRIGGERS, которые есть в базе"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tgname FROM pg_trigger WHERE NOT tgisinternal AND tgname = ANY(%s)",
+            [list(TRIGGERS)],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def install_triggers() -> None:
+    with connection.cursor() as cursor:
+        # CREATE TRIGGER без OR REPLACE: повторная установка - снять и поставить заново
+        cursor.execute(DROP_SQL)
+        cursor.execute(INSTALL_SQL)
+
+
+def drop_triggers() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(DROP_SQL)
+
+
+@checks.register(checks.Tags.database)
+def check_tree_triggers(app_configs=None, databases=None, **kwargs):
+    if not databases or "default" not in databases or connection.vendor != "postgresql":
+        return []
+    try:
+        installed = installed_triggers()
+    except DatabaseError:
+        # База недоступна: об этом сообщат сами migrate/check
+        return []
+    if settings.DEPARTMENT_TREE_TRIGGERS and installed != set(TRIGGERS):
+        return [checks.Warning(
+            "DJANGO_TREE_TRIGGERS включен, но триггеров дерева в базе нет (или не все): "
+            "path отделов и structure_path сотрудников не будут заполняться",
+            hint="python manage.py tree_triggers install",
+            id="employers.W001",
+        )]
+    if not settings.DEPARTMENT_TREE_TRIGGERS and installed:
+        return [checks.Warning(
+            "Триггеры дерева стоят в базе при выключенном DJANGO_TREE_TRIGGERS: "
+            "пути пересчитываются дважды",
+            hint="python manage.py tree_triggers drop",
+            id="employers.W002",
+        )]
+    return []
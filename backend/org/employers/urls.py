@@ -1,10 +1,33 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import DepartmentEmployeesView, DepartmentLTreeView
+from .async_views import AsyncDepartmentEmployeesView, AsyncDepartmentLTreeView
+from .views import (
+    DepartmentAnalyticsView,
+    DepartmentChildrenView,
+    DepartmentEmployeesBatchView,
+    DepartmentEmployeesView,
+    DepartmentExportView,
+    DepartmentLTreeView,
+    EmployeeListApiView,
+    EmployeeSearchApiView,
+)
 
 app_name = 'employers'
 
+if settings.ASYNC_VIEWS:
+    tree_view, employees_view = AsyncDepartmentLTreeView, AsyncDepartmentEmployeesView
+else:
+    tree_view, employees_view = DepartmentLTreeView, DepartmentEmployeesView
+
 urlpatterns = [
-    path('', DepartmentLTreeView.as_view(), name='department_tree'),
-    path('employees/', DepartmentEmployeesView.as_view(), name='department_employees'),
+    path('', tree_view.as_view(), name='department_tree'),
+    path('employees/', employees_view.as_view(), name='department_employees'),
+    path('employees/batch/', DepartmentEmployeesBatchView.as_view(), name='department_employees_batch'),
+    path('departments/<int:department_id>/children/', DepartmentChildrenView.as_view(), name='department_children'),
+    path('api/employees/', EmployeeListApiView.as_view(), name='employees_api'),
+    path('api/employees/search/', EmployeeSearchApiView.as_view(), name='employees_search'),
+    path('api/departments/<int:department_id>/analytics/', DepartmentAnalyticsView.as_view(),
+         name='department_analytics'),
+    path('export/', DepartmentExportView.as_view(), name='department_export'),
 ]
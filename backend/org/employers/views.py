@@ -1,13 +1,42 @@
-from django.core.cache import cache
-from django.core.paginator import Paginator
-from django.db import connection
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
-from django.views.generic import TemplateView
+from django.utils.decorators import method_decorator
+from django.views.generic import TemplateView, View
 
-from .models import Department, Employee
+from org.utils.db_router import read_alias
+from org.utils.serializers import FastJsonResponse, to_json_value
 
+from .analytics import get_department_analytics
+from .conditional import tree_conditional
+from .employee_pages import (
+    FIRST_CURSOR_PAGE,
+    PageRequest,
+    batch_payloads,
+    cursor_context,
+    cursor_payload,
+    department_employees,
+    get_page_payload,
+    get_total_count,
+    page_context,
+    page_number,
+)
+from .export import EXPORT_FORMATS, iter_export
+from .models import Department
+from .pagination import InvalidCursor, decode_cursor, keyset_paginate
+from .replicas import read_from_replica
+from .search import MIN_QUERY_LENGTH, search_employees
+from .subtree import can_merge, get_branch_paths, keyset_page
+from .tree_cache import get_child_departments, get_root_departments
+from .tree_index import get_department, get_departments
 
+
+def department_from_request(request):
+    """Отдел из ?department_id= через индекс дерева; ValueError/TypeError - некорректный id"""
+    return get_department(int(request.GET.get('department_id')))
+
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
 class DepartmentLTreeView(TemplateView):
     """Отображение древовидной структуры отделов со сотрудниками"""
     template_name = 'employers/department_tree.html'
@@ -15,99 +44,313 @@ class DepartmentLTreeView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Кеширование структуры отделов с количеством сотрудников
-        cache_key = 'department_tree_structure'
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            print(f"cached_data: {cached_data}")
-            departments_dict, root_departments = cached_data
-        else:
-            departments = Department.objects.select_related('parent').order_by('path')
-            departments_dict = {dept.id: dept for dept in departments}
+        # Версионируемый снимок дерева (см. tree_cache): ветки подгружаются по запросу
+        root_departments = get_root_departments()
 
-            # Используем structure_path для подсчета сотрудников каждого отдела
-            # Это более эффективно, так как использует GIST индекс на structure_path
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT d.id, COUNT(e.id) as employees_count
-                    FROM employers_department d
-                    LEFT JOIN employers_employee e ON e.structure_path = d.path
-                    GROUP BY d.id
-                """)
-                counts_dict = {row[0]: row[1] for row in cursor.fetchall()}
+        context['root_departments'] = root_departments
 
-            for dept_id, dept in departments_dict.items():
-                dept.employees_count = counts_dict.get(dept_id, 0)
+        return context
 
-            root_departments = [dept for dept in departments if dept.parent_id is None]
 
-            cache.set(cache_key, (departments_dict, root_departments), 300)
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class DepartmentChildrenView(View):
+    """AJAX view для ленивой подгрузки дочерних отделов с численностью"""
+    template_name = 'employers/department_nodes.html'
 
-        context['departments_dict'] = departments_dict
-        context['root_departments'] = root_departments
+    def get(self, request, department_id, *args, **kwargs):
+        children = get_child_departments(department_id)
+        if children is None:
+            # Отдела еще нет в снимке (например, отдается устаревший на время перестроения)
+            children = list(
+                Department.objects.filter(parent_id=department_id).with_tree_info().order_by('path').values(
+                    'id', 'name', 'level', 'employees_count', 'subtree_count', 'has_children'
+                )
+            )
+            if not children and not Department.objects.filter(pk=department_id).exists():
+                return JsonResponse({'error': 'Отдел не найден'}, status=404)
 
-        return context
+        html = render_to_string(self.template_name, {'departments': children}, request=request)
+        return JsonResponse({
+            'html': html,
+            'children': [
+                {
+                    'id': dept['id'],
+                    'name': dept['name'],
+                    'level': dept['level'],
+                    'employees_count': dept['employees_count'],
+                    'subtree_count': dept['subtree_count'],
+                    'has_children': dept['has_children'],
+                }
+                for dept in children
+            ],
+        })
 
 
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
 class DepartmentEmployeesView(TemplateView):
-    """AJAX view для получения пагинированного списка сотрудников отдела(возможно есть смысл кэшировать на уровне L7)"""
+    """
+    AJAX view для получения пагинированного списка сотрудников отдела (ETag по версии дерева -
+    см. conditional.py, первые страницы - из кеша на версию дерева, см. employee_pages.py)
+    """
     template_name = 'employers/employees_list.html'
+    MAX_PER_PAGE = 100
 
     def get(self, request, *args, **kwargs):
-        department_id = request.GET.get('department_id')
-        page = request.GET.get('page', 1)
-        per_page = int(request.GET.get('per_page', 10))
         include_subtree = request.GET.get('include_subtree', 'false').lower() == 'true'
+        # pagination=cursor включает seek-пагинацию: без OFFSET и COUNT(*)
+        use_cursor = request.GET.get('pagination') == 'cursor'
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
+        # Отдел, его путь и численность - из индекса дерева в памяти процесса (tree_index.py)
         try:
-            department = Department.objects.get(pk=department_id)
-        except Department.DoesNotExist:
+            per_page = max(min(int(request.GET.get('per_page', 10)), self.MAX_PER_PAGE), 1)
+            department = department_from_request(request)
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+        if department is None:
             return JsonResponse({'error': 'Отдел не найден'}, status=404)
 
-        # Получаем path отдела
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT path::text FROM employers_department WHERE id = %s",
-                [department_id]
-            )
-            row = cursor.fetchone()
-            dept_path = row[0] if row and row[0] else str(department_id)
-
-        if include_subtree:
-            employees = Employee.objects.extra(
-                where=["structure_path <@ %s::ltree"],
-                params=[dept_path]
-            ).select_related('department').order_by('full_name')
+        if use_cursor and (after or before):
+            try:
+                context = cursor_context(department, include_subtree, per_page, after=after, before=before)
+            except InvalidCursor:
+                return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+            if is_ajax:
+                return JsonResponse(cursor_payload(context, request))
+            return self.render_to_response(context)
+
+        if use_cursor:
+            page = FIRST_CURSOR_PAGE
         else:
-            employees = Employee.objects.filter(
-                structure_path=dept_path
-            ).select_related('department').order_by('full_name')
+            page = page_number(department, include_subtree, request.GET.get('page', 1), per_page)
 
-        paginator = Paginator(employees, per_page)
+        if is_ajax:
+            payload = get_page_payload(department, include_subtree, page, per_page)
+            return JsonResponse(payload)
+
+        if use_cursor:
+            context = cursor_context(department, include_subtree, per_page)
+        else:
+            context = page_context(department, include_subtree, page, per_page)
+        return self.render_to_response(context)
 
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class DepartmentEmployeesBatchView(View):
+    """
+    AJAX-ответы DepartmentEmployeesView для нескольких отделов одним запросом: отделы - из
+    индекса дерева, страницы - из кеша или одним запросом к БД (employee_pages.batch_payloads).
+    Пример: ?department_id=1&department_id=2&include_subtree.2=true&page.1=3
+    Общие include_subtree, pagination и per_page переопределяются для отдела параметрами
+    include_subtree.<id>, page.<id> и after.<id>. Ответ: {"results": {"<id>": ответ отдела}}.
+    """
+    MAX_PER_PAGE = DepartmentEmployeesView.MAX_PER_PAGE
+    MAX_DEPARTMENTS = 50
+
+    def get(self, request, *args, **kwargs):
+        params = request.GET
         try:
-            page_obj = paginator.page(int(page))
-        except:
-            page_obj = paginator.page(1)
-
-        context = {
-            'employees': page_obj,
-            'department': department,
-            'page_obj': page_obj,
-            'include_subtree': include_subtree,
-        }
-
-        # Если это AJAX запрос, возвращаем JSON с HTML
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            html = render_to_string(self.template_name, context, request=request)
-            return JsonResponse({
-                'html': html,
-                'has_previous': page_obj.has_previous(),
-                'has_next': page_obj.has_next(),
-                'current_page': page_obj.number,
-                'num_pages': page_obj.paginator.num_pages,
-                'total_count': page_obj.paginator.count,
-            })
+            department_ids = list(dict.fromkeys(int(value) for value in params.getlist('department_id')))
+            per_page = max(min(int(params.get('per_page', 10)), self.MAX_PER_PAGE), 1)
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+        if not department_ids or len(department_ids) > self.MAX_DEPARTMENTS:
+            return JsonResponse(
+                {'error': f'Нужно от 1 до {self.MAX_DEPARTMENTS} параметров department_id'}, status=400
+            )
 
-        return self.render_to_response(context)
+        include_subtree = params.get('include_subtree', 'false').lower() == 'true'
+        use_cursor = params.get('pagination') == 'cursor'
+        departments = get_departments(department_ids)
+
+        results = {}
+        page_requests = []
+        for dept_id in department_ids:
+            department = departments.get(dept_id)
+            if department is None:
+                results[dept_id] = {'error': 'Отдел не найден'}
+                continue
+
+            subtree = params.get(f'include_subtree.{dept_id}', str(include_subtree)).lower() == 'true'
+            after = params.get(f'after.{dept_id}') if use_cursor else None
+            if after:
+                try:
+                    decode_cursor(after)
+                except InvalidCursor:
+                    results[dept_id] = {'error': 'Некорректный курсор'}
+                    continue
+            if use_cursor:
+                page = FIRST_CURSOR_PAGE
+            else:
+                page = page_number(department, subtree, params.get(f'page.{dept_id}', 1), per_page)
+            page_requests.append(PageRequest(department, subtree, page, per_page, after=after or None))
+
+        payloads = batch_payloads(page_requests)
+        for page_request, payload in zip(page_requests, payloads):
+            results[page_request.department['id']] = payload
+        # Порядок ответа - порядок department_id в запросе
+        return JsonResponse({'results': {str(dept_id): results[dept_id] for dept_id in department_ids}})
+
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class EmployeeListApiView(View):
+    """
+    JSON API списка сотрудников отдела: только запрошенные колонки через .values(),
+    seek-пагинация по курсору, без рендеринга шаблона.
+    Пример: /api/employees/?department_id=1&include_subtree=true&fields=full_name,salary&after=<cursor>
+    """
+    ALLOWED_FIELDS = ('id', 'full_name', 'position', 'hired_at', 'salary', 'department_id')
+    DEFAULT_FIELDS = ('id', 'full_name', 'position', 'hired_at', 'salary', 'department_id')
+    MAX_PER_PAGE = 100
+
+    def get(self, request, *args, **kwargs):
+        include_subtree = request.GET.get('include_subtree', 'false').lower() == 'true'
+        fields = [name for name in request.GET.get('fields', '').split(',') if name] or self.DEFAULT_FIELDS
+        unknown = set(fields) - set(self.ALLOWED_FIELDS)
+        if unknown:
+            return FastJsonResponse({'error': f'Неизвестные поля: {", ".join(sorted(unknown))}'}, status=400)
+
+        try:
+            per_page = min(int(request.GET.get('per_page', 10)), self.MAX_PER_PAGE)
+            department = department_from_request(request)
+        except (ValueError, TypeError):
+            return FastJsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+        if department is None:
+            return FastJsonResponse({'error': 'Отдел не найден'}, status=404)
+
+        per_page = max(per_page, 1)
+        dept_path = department['path']
+        branch_paths = get_branch_paths(dept_path, department['id']) if include_subtree else None
+        try:
+            if branch_paths is not None and can_merge(len(branch_paths), per_page + 1):
+                page = keyset_page(
+                    branch_paths,
+                    fields,
+                    per_page,
+                    after=request.GET.get('after'),
+                    before=request.GET.get('before'),
+                )
+            else:
+                # full_name и id нужны для курсора, даже если их не запросили
+                employees = department_employees(dept_path, include_subtree).values(*{*fields, 'id', 'full_name'})
+                page = keyset_paginate(
+                    employees,
+                    per_page,
+                    after=request.GET.get('after'),
+                    before=request.GET.get('before'),
+                )
+        except InvalidCursor:
+            return FastJsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+        return FastJsonResponse({
+            'results': [{name: to_json_value(row[name]) for name in fields} for row in page.employees],
+            'has_previous': page.has_previous,
+            'has_next': page.has_next,
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+            'total_count': get_total_count(department, include_subtree),
+        })
+
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class EmployeeSearchApiView(View):
+    """
+    Поиск сотрудников по ФИО / должности (pg_trgm), опционально в поддереве отдела.
+    Пример: /api/employees/search/?q=иванов&department_id=1&after=<cursor>
+    """
+    MAX_PER_PAGE = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        if len(query) < MIN_QUERY_LENGTH:
+            return FastJsonResponse(
+                {'error': f'Поисковый запрос должен содержать не меньше {MIN_QUERY_LENGTH} символов'}, status=400
+            )
+
+        dept_path = None
+        try:
+            per_page = max(min(int(request.GET.get('per_page', 20)), self.MAX_PER_PAGE), 1)
+            if request.GET.get('department_id'):
+                department = department_from_request(request)
+                if department is None:
+                    return FastJsonResponse({'error': 'Отдел не найден'}, status=404)
+                dept_path = department['path']
+        except (ValueError, TypeError):
+            return FastJsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+
+        try:
+            page = search_employees(query, dept_path, per_page, after=request.GET.get('after'))
+        except InvalidCursor:
+            return FastJsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+        return FastJsonResponse({
+            'results': page.results,
+            'has_next': page.has_next,
+            'next_cursor': page.next_cursor,
+        })
+
+
+@method_decorator(read_from_replica, name='get')
+class DepartmentExportView(View):
+    """Потоковая выгрузка сотрудников поддерева: /export/?department_id=1&format=csv|ndjson"""
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return JsonResponse({'error': 'Неизвестный формат выгрузки'}, status=400)
+        include_subtree = request.GET.get('include_subtree', 'true').lower() == 'true'
+
+        try:
+            department = department_from_request(request)
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Некорректные параметры запроса'}, status=400)
+        if department is None:
+            return JsonResponse({'error': 'Отдел не найден'}, status=404)
+
+        response = StreamingHttpResponse(
+            iter_export(department['path'], export_format, include_subtree, using=read_alias()),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="department_{department["id"]}.{export_format}"'
+        return response
+
+
+@method_decorator(tree_conditional, name='get')
+@method_decorator(read_from_replica, name='get')
+class DepartmentAnalyticsView(View):
+    """
+    Зарплатная аналитика поддерева отдела: численность, сумма/среднее/мин/макс, перцентили
+    и разбивка по должностям. Свертки готовятся сразу для всех отделов (см. analytics.py).
+    """
+
+    def get(self, request, department_id, *args, **kwargs):
+        if get_department(department_id) is None:
+            return FastJsonResponse({'error': 'Отдел не найден'}, status=404)
+
+        analytics = get_department_analytics(department_id)
+        return FastJsonResponse({
+            'department_id': department_id,
+            'headcount': analytics['headcount'],
+            'salary': salary_json(analytics['salary']),
+            'positions': [
+                {
+                    'position': item['position'],
+                    'headcount': item['headcount'],
+                    'salary': salary_json(item['salary']),
+                }
+                for item in analytics['positions']
+            ],
+        })
+
+
+def salary_json(stats):
+    if stats is None:
+        return None
+    return {name: to_json_value(value) for name, value in stats.items()}
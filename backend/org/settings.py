@@ -31,6 +31,7 @@ DJANGO_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 LOCAL_APPS = [
@@ -55,6 +56,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "django_structlog.middlewares.RequestMiddleware",
+    # После RequestMiddleware: метрики запроса должны попасть в его request_finished
+    "org.utils.instrumentation.RequestMetricsMiddleware",
+    # cookie read-your-writes для клиента, который писал (чтения с реплик, org/utils/db_router.py)
+    "org.utils.db_router.StickyPrimaryMiddleware",
 ]
 
 # SENTRY
@@ -100,12 +105,35 @@ CACHES = {
         'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': f'{REDIS_SSL}://{CHANNELS_REDIS_HOST}:{CHANNELS_REDIS_PORT}/{CHANNELS_REDIS_DB}',
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # DefaultClient + счетчики попаданий/промахов для метрик запроса
+            'CLIENT_CLASS': 'org.utils.instrumentation.InstrumentedRedisClient',
         }
     }
 }
 
-CHANNELS_LAYERS = {
+# Снимок дерева отделов (org/employers/tree_cache.py): инвалидируется по версии, TTL - страховка
+DEPARTMENT_TREE_CACHE_TTL = env.int("DEPARTMENT_TREE_CACHE_TTL", default=24 * 60 * 60)
+# Дополнительный кеш снимка в памяти процесса перед Redis
+DEPARTMENT_TREE_LOCAL_CACHE = env.bool("DEPARTMENT_TREE_LOCAL_CACHE", default=True)
+
+# Кеш готовых страниц сотрудников на версию дерева (org/employers/employee_pages.py):
+# первые EMPLOYEE_PAGE_CACHE_PAGES страниц и первая страница курсорной пагинации
+EMPLOYEE_PAGE_CACHE = env.bool("EMPLOYEE_PAGE_CACHE", default=True)
+EMPLOYEE_PAGE_CACHE_PAGES = env.int("EMPLOYEE_PAGE_CACHE_PAGES", default=3)
+# Журнал отделов с устаревшими страницами для `warm_employee_cache --watch`, который догревает
+# только их (отдельным процессом, не в веб-сервере)
+EMPLOYEE_PAGE_WARM_ON_CHANGE = env.bool("EMPLOYEE_PAGE_WARM_ON_CHANGE", default=False)
+
+# Массовые операции над сотрудниками (org/employers/bulk.py): сотрудников в одном UPDATE/транзакции
+EMPLOYEE_BULK_BATCH_SIZE = env.int("EMPLOYEE_BULK_BATCH_SIZE", default=5000)
+
+# Cache-Control страниц и API дерева: max-age в секундах, дальше - перепроверка по ETag (304)
+HTTP_CACHE_MAX_AGE = env.int("HTTP_CACHE_MAX_AGE", default=0)
+
+# Админка: точный COUNT(*) по отфильтрованному списку не дольше этого, дальше - оценка планировщика
+ADMIN_COUNT_TIMEOUT_MS = env.int("ADMIN_COUNT_TIMEOUT_MS", default=200)
+
+CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
         "CONFIG": {
@@ -126,11 +154,17 @@ CHANNELS_LAYERS = {
     }
 }
 
+# Живая численность отделов по websocket (org/employers/consumers.py):
+# изменения копятся и уходят клиенту одним сообщением раз в HEADCOUNT_PUSH_INTERVAL_MS
+HEADCOUNT_PUSH = env.bool("HEADCOUNT_PUSH", default=True)
+HEADCOUNT_PUSH_INTERVAL_MS = env.int("HEADCOUNT_PUSH_INTERVAL_MS", default=500)
+
 ROOT_URLCONF = 'org.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates + время рендера для метрик запроса
+        'BACKEND': 'org.utils.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -151,6 +185,20 @@ APPEND_SPLASH = False
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Пул соединений psycopg 3 (встроенный в Django 5.1+), одинаково работает под gunicorn и daphne.
+# Пул - на процесс: max_size не меньше числа потоков воркера (--threads в start.sh)
+DB_POOL = env.bool("DB_POOL", default=True)
+DB_POOL_OPTIONS = {
+    "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+    "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+    # Сколько секунд ждать свободное соединение, прежде чем отдать ошибку
+    "timeout": env.float("DB_POOL_TIMEOUT", default=10.0),
+    "max_idle": env.float("DB_POOL_MAX_IDLE", default=600.0),
+    "max_lifetime": env.float("DB_POOL_MAX_LIFETIME", default=3600.0),
+}
+# Статистика пулов (занято, ожидают, время ожидания) пишется в лог не чаще раза в N секунд, 0 - выключено
+DB_POOL_STATS_INTERVAL = env.int("DB_POOL_STATS_INTERVAL", default=60)
+
 DJANGO_MEMORY_DB = env.bool("DJANGO_MEMORY_DB", default=False)
 if not DJANGO_MEMORY_DB:
     DATABASES = {
@@ -166,8 +214,21 @@ if not DJANGO_MEMORY_DB:
             },
             # server-side курсоры не работают с connection pool
             "DISABLE_SERVER_SIDE_CURSORS": True,
+            "OPTIONS": {"pool": {"name": "default", **DB_POOL_OPTIONS}} if DB_POOL else {},
         }
     }
+    # Реплики только для чтения: "host:port,host:port", остальные параметры - как у default.
+    # С реплик читают дерево, списки сотрудников, выгрузка и аналитика (org/employers/replicas.py)
+    for number, replica in enumerate(env.list("POSTGRES_REPLICA_HOSTS", default=[]), start=1):
+        replica_host, _, replica_port = replica.partition(":")
+        DATABASES[f"replica{number}"] = {
+            **DATABASES["default"],
+            "HOST": replica_host,
+            "PORT": int(replica_port or DATABASES["default"]["PORT"]),
+            "OPTIONS": {"pool": {"name": f"replica{number}", **DB_POOL_OPTIONS}} if DB_POOL else {},
+            # В тестах реплика - та же тестовая БД, что default
+            "TEST": {"MIRROR": "default"},
+        }
 else:
     DATABASES = {
         'default': {
@@ -176,6 +237,25 @@ else:
         }
     }
 
+DB_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["org.utils.db_router.ReplicaRouter"]
+# Столько секунд после своей записи (POST/PUT/PATCH/DELETE) клиент читает из основной БД: реплика
+# может отставать; остальные клиенты продолжают читать с реплик
+DB_REPLICA_STICKY_SECONDS = env.int("DB_REPLICA_STICKY_SECONDS", default=5)
+
+# Async-варианты дерева и списка сотрудников (org/employers/async_views.py).
+# Включать только под ASGI (daphne): под WSGI каждый запрос получал бы свой event loop и пул
+ASYNC_VIEWS = env.bool("DJANGO_ASYNC_VIEWS", default=False)
+ASYNC_DB_POOL = {
+    **DB_POOL_OPTIONS,
+    "min_size": env.int("ASYNC_DB_POOL_MIN_SIZE", default=1),
+    "max_size": env.int("ASYNC_DB_POOL_MAX_SIZE", default=10),
+}
+
+# path/level отделов и structure_path сотрудников считают триггеры PostgreSQL вместо
+# SELECT/UPDATE в save(); триггеры ставит `manage.py tree_triggers install` (org/employers/tree_triggers.py)
+DEPARTMENT_TREE_TRIGGERS = env.bool("DJANGO_TREE_TRIGGERS", default=False)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -219,6 +299,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ---- LOGGING ----
 DB_DEBUG = env("DJANGO_DB_DEBUG", default=False)
+# Запросы дольше порога (мс) пишутся событием slow_query с SQL и планом; 0 - выключено
+DB_SLOW_QUERY_MS = env.int("DJANGO_DB_SLOW_QUERY_MS", default=0)
 
 STRUCTLOG_PROCESSORS = [
     structlog.contextvars.merge_contextvars,
@@ -0,0 +1,97 @@
+"""
+Асинхронный доступ к кешу Django через redis.asyncio.
+
+Ключи и сериализация берутся у клиента django-redis (make_key / encode / decode),
+поэтому значения общие с синхронным `django.core.cache.cache`. Для других бекендов
+(например, locmem в локальной разработке) используются встроенные cache.aget/aset.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import weakref
+
+from django.core.cache import cache, caches
+from django_redis.cache import RedisCache
+from redis.asyncio import Redis
+
+from org.utils.instrumentation import record_cache
+
+_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Redis] = weakref.WeakKeyDictionary()
+
+
+def _django_redis_client():
+    backend = caches["default"]
+    return backend.client if isinstance(backend, RedisCache) else None
+
+
+def _get_redis() -> Redis:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        location = caches["default"]._server
+        # Как и django-redis: первый адрес - мастер
+        if isinstance(location, str):
+            location = location.split(",")
+        location = location[0]
+        client = Redis.from_url(location)
+        _clients[loop] = client
+    return client
+
+
+def _timeout(timeout):
+    """Таймаут в секундах для SET EX; None - без истечения"""
+    if timeout is None:
+        return None
+    return max(int(timeout), 1)
+
+
+async def aget(key: str, default=None):
+    client = _django_redis_client()
+    if client is None:
+        return await cache.aget(key, default)
+    started = time.perf_counter()
+    value = await _get_redis().get(client.make_key(key))
+    # Как InstrumentedRedisClient.get для синхронного кеша
+    record_cache(int(value is not None), int(value is None), (time.perf_counter() - started) * 1000)
+    if value is None:
+        return default
+    return client.decode(value)
+
+
+async def aget_many(keys) -> dict:
+    """Как cache.get_many: только найденные ключи"""
+    keys = list(keys)
+    if not keys:
+        return {}
+    client = _django_redis_client()
+    if client is None:
+        return await cache.aget_many(keys)
+    started = time.perf_counter()
+    values = await _get_redis().mget([client.make_key(key) for key in keys])
+    found = {key: client.decode(value) for key, value in zip(keys, values) if value is not None}
+    record_cache(len(found), len(keys) - len(found), (time.perf_counter() - started) * 1000)
+    return found
+
+
+async def aset(key: str, value, timeout=None) -> None:
+    client = _django_redis_client()
+    if client is None:
+        await cache.aset(key, value, timeout)
+        return
+    await _get_redis().set(client.make_key(key), client.encode(value), ex=_timeout(timeout))
+
+
+async def aadd(key: str, value, timeout=None) -> bool:
+    client = _django_redis_client()
+    if client is None:
+        return await cache.aadd(key, value, timeout)
+    return bool(await _get_redis().set(client.make_key(key), client.encode(value), ex=_timeout(timeout), nx=True))
+
+
+async def adelete(key: str) -> None:
+    client = _django_redis_client()
+    if client is None:
+        await cache.adelete(key)
+        return
+    await _get_redis().delete(client.make_key(key))
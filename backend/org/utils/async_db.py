@@ -0,0 +1,98 @@
+"""
+Асинхронный доступ к PostgreSQL для async-views под ASGI (daphne).
+
+Django ORM в async-коде все равно уходит в поток через sync_to_async, поэтому горячие
+запросы выполняются напрямую через psycopg 3 AsyncConnectionPool. Пул свой у каждого
+event loop (соединения psycopg привязаны к циклу, в котором открыты) и алиаса БД:
+внутри db_router.use_replica запросы идут на реплику.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import weakref
+
+from django.conf import settings
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from org.utils import db_router, instrumentation
+
+_pools: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, AsyncConnectionPool]
+] = weakref.WeakKeyDictionary()
+
+
+def _conninfo(alias: str = "default") -> str:
+    db = settings.DATABASES[alias]
+    return make_conninfo(
+        dbname=db["NAME"],
+        user=db.get("USER") or None,
+        password=db.get("PASSWORD") or None,
+        host=db.get("HOST") or None,
+        port=db.get("PORT") or None,
+    )
+
+
+async def get_pool(alias: str | None = None) -> AsyncConnectionPool:
+    alias = alias or db_router.read_alias()
+    loop_pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    pool = loop_pools.get(alias)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            _conninfo(alias),
+            # Только чтение: autocommit убирает BEGIN/COMMIT вокруг каждого запроса
+            kwargs={"autocommit": True, "row_factory": dict_row},
+            open=False,
+            name="async" if alias == "default" else f"async_{alias}",
+            **settings.ASYNC_DB_POOL,
+        )
+        loop_pools[alias] = pool
+    if pool.closed:
+        # open() идемпотентен: параллельные первые запросы дождутся одного открытия
+        await pool.open()
+    return pool
+
+
+async def _execute(conn, sql: str, params):
+    """conn.execute с учетом в метриках запроса и логом медленных запросов (utils.instrumentation)"""
+    started = time.perf_counter()
+    cursor = await conn.execute(sql, params)
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    instrumentation.record_query(duration_ms)
+    if instrumentation.is_slow(duration_ms):
+        plan = None
+        if instrumentation.can_explain(sql):
+            try:
+                explain = await conn.execute(f"EXPLAIN {sql}", params)
+                plan = [row["QUERY PLAN"] for row in await explain.fetchall()]
+            except Exception:
+                instrumentation.logger.warning("slow_query_explain_failed", exc_info=True)
+        instrumentation.log_slow_query(sql, duration_ms, plan, alias="async")
+    return cursor
+
+
+async def fetch_all(sql: str, params=None) -> list[dict]:
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        cursor = await _execute(conn, sql, params)
+        return await cursor.fetchall()
+
+
+async def fetch_one(sql: str, params=None) -> dict | None:
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        cursor = await _execute(conn, sql, params)
+        return await cursor.fetchone()
+
+
+def get_pools() -> list[AsyncConnectionPool]:
+    return [pool for loop_pools in list(_pools.values()) for pool in loop_pools.values()]
+
+
+async def close_pools() -> None:
+    for pool in get_pools():
+        await pool.close()
+    _pools.clear()
@@ -0,0 +1,12 @@
+from collections.abc import Iterable, Sequence
+
+
+def copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> None:
+    """
+    Потоково загружает строки через COPY FROM STDIN, не собирая их в памяти.
+    cursor - django-курсор (connection.cursor()) поверх psycopg 3.
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    with cursor.cursor.copy(sql) as copy:
+        for row in rows:
+            copy.write_row(row)
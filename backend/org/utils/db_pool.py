@@ -0,0 +1,91 @@
+"""
+Статистика пулов соединений psycopg_pool для подбора их размера под реальную нагрузку.
+
+Счетчики (запросы, ожидания, ошибки) снимаются через pop_stats(), то есть каждая
+запись в логе - приращение за интервал с прошлой записи; размеры пула - мгновенные.
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+import structlog
+from django.conf import settings
+from django.db import connections
+
+from org.utils import async_db
+
+logger = structlog.get_logger(__name__)
+
+_lock = threading.Lock()
+_last_logged = 0.0
+
+
+def pool_stats(pool) -> dict:
+    stats = pool.pop_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    queued = stats.get("requests_queued", 0)
+    wait_ms = stats.get("requests_wait_ms", 0)
+    return {
+        "pool": pool.name,
+        "min_size": stats.get("pool_min", 0),
+        "max_size": stats.get("pool_max", 0),
+        "size": size,
+        "checked_out": size - available,
+        "available": available,
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": stats.get("requests_num", 0),
+        "queued": queued,
+        "wait_ms": wait_ms,
+        "avg_wait_ms": round(wait_ms / queued, 1) if queued else 0,
+        "timeouts": stats.get("requests_errors", 0),
+        "usage_ms": stats.get("usage_ms", 0),
+        "connections_opened": stats.get("connections_num", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+    }
+
+
+def get_pools() -> list:
+    """Уже созданные пулы: синхронные пулы Django по алиасам БД и async-пулы"""
+    pools = []
+    for conn in connections.all():
+        # Не conn.pool: это свойство создает пул, если его еще нет
+        pool = getattr(conn, "_connection_pools", {}).get(conn.alias)
+        if pool is not None:
+            pools.append(pool)
+    return pools + async_db.get_pools()
+
+
+def log_pool_stats() -> None:
+    for pool in get_pools():
+        logger.info("db_pool_stats", **pool_stats(pool))
+
+
+def close_pools() -> None:
+    """
+    Закрывает соединения и синхронные пулы Django, например перед fork:
+    дочерний процесс не должен унаследовать сокеты и фоновые потоки пула родителя.
+    """
+    for conn in connections.all():
+        conn.close()
+        if getattr(conn, "_connection_pools", {}).get(conn.alias) is not None:
+            conn.close_pool()
+
+
+def maybe_log_pool_stats() -> None:
+    """Пишет статистику не чаще DB_POOL_STATS_INTERVAL секунд (вызывается по окончании запроса)"""
+    global _last_logged
+
+    interval = settings.DB_POOL_STATS_INTERVAL
+    if not interval or time.monotonic() - _last_logged < interval:
+        return
+    # Из нескольких потоков, закончивших запрос одновременно, пишет только один
+    if not _lock.acquire(blocking=False):
+        return
+    try:
+        if time.monotonic() - _last_logged >= interval:
+            _last_logged = time.monotonic()
+            log_pool_stats()
+    finally:
+        _lock.release()
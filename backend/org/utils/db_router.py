@@ -0,0 +1,122 @@
+"""
+Чтение с реплик PostgreSQL (DB_REPLICAS в settings).
+
+Реплика выбирается только явно - на время view, обернутого в use_replica (см.
+employers/replicas.py), - и лежит в contextvar. Все остальное: запись, админка,
+management-команды, сигналы и транзакции - идет в основную БД, как и без реплик.
+Сырой SQL на чтение берет соединение через read_connection(), ORM - через ReplicaRouter.
+
+Read-your-writes - для того клиента, который писал: StickyPrimaryMiddleware ставит cookie
+STICKY_COOKIE на DB_REPLICA_STICKY_SECONDS после его POST/PUT/PATCH/DELETE (админка, массовые
+операции), и пока она жива, его чтения идут в основную БД (wrote_recently). Остальные клиенты
+читают с реплик и сразу после чужой записи.
+"""
+from __future__ import annotations
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica: ContextVar[str | None] = ContextVar("db_replica", default=None)
+
+STICKY_COOKIE = "db_primary_until"
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def read_alias() -> str:
+    """Алиас БД для чтения в текущем контексте: реплика или default"""
+    return _replica.get() or DEFAULT_DB_ALIAS
+
+
+def read_connection():
+    return connections[read_alias()]
+
+
+def on_replica() -> bool:
+    return _replica.get() is not None
+
+
+def may_lag(modified: int) -> bool:
+    """Данные менялись в последние DB_REPLICA_STICKY_SECONDS: реплика может их еще не видеть"""
+    # modified - целые секунды (округление вниз), отсюда +1
+    return time.time() < modified + settings.DB_REPLICA_STICKY_SECONDS + 1
+
+
+def wrote_recently(request) -> bool:
+    """Клиент сам писал в последние DB_REPLICA_STICKY_SECONDS: реплика может не видеть его записи"""
+    try:
+        return time.time() < int(request.COOKIES.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+
+
+class StickyPrimaryMiddleware:
+    """Ставит STICKY_COOKIE (срок - время, до которого читать из основной БД) на ответ записи"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._mark(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._mark(request, await self.get_response(request))
+
+    def _mark(self, request, response):
+        if settings.DB_REPLICAS and request.method in WRITE_METHODS:
+            seconds = settings.DB_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time()) + seconds + 1),
+                max_age=seconds + 1, httponly=True, samesite="Lax",
+            )
+        return response
+
+
+@contextmanager
+def use_replica():
+    """Чтения внутри блока - со случайной реплики; без реплик ничего не меняет"""
+    replicas = settings.DB_REPLICAS
+    token = _replica.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Чтения внутри блока - из основной БД, даже внутри use_replica"""
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    """Реплики - копии default: связи между ними разрешены, миграции - только в default"""
+
+    def db_for_read(self, model, **hints):
+        # None - решает Django (default или БД связанного объекта)
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,214 @@
+"""
+Метрики запроса для structlog: число и время SQL-запросов, попадания и промахи кеша,
+время рендера шаблонов.
+
+Счетчики текущего запроса лежат в contextvar (RequestMetricsMiddleware) и пополняются
+из execute_wrapper соединений Django, async_db, клиента django-redis (CLIENT_CLASS) и
+бекенда шаблонов. В конце запроса они привязываются к контексту structlog и попадают в
+событие request_finished django_structlog. Запросы дольше DB_SLOW_QUERY_MS пишутся
+отдельным событием slow_query вместе с планом (EXPLAIN, без ANALYZE - запрос не повторяется).
+"""
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import structlog
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+from django_redis.client import DefaultClient
+
+logger = structlog.get_logger(__name__)
+
+# План имеет смысл только для DML; SAVEPOINT, COPY, DDL и т.п. EXPLAIN не поддерживает
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+_MISSING = object()
+
+
+@dataclass
+class RequestMetrics:
+    db_queries: int = 0
+    db_ms: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    cache_ms: float = 0.0
+    templates: int = 0
+    template_ms: float = 0.0
+
+    def as_log_context(self) -> dict:
+        return {
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_ms, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_ms": round(self.cache_ms, 1),
+            "templates": self.templates,
+            "template_ms": round(self.template_ms, 1),
+        }
+
+
+_metrics: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+def current_metrics() -> RequestMetrics | None:
+    return _metrics.get()
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def is_slow(duration_ms: float) -> bool:
+    threshold = settings.DB_SLOW_QUERY_MS
+    return bool(threshold) and duration_ms >= threshold
+
+
+def can_explain(sql: str) -> bool:
+    return sql.lstrip(" \n\t(").upper().startswith(EXPLAINABLE)
+
+
+def record_query(duration_ms: float) -> None:
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.db_queries += 1
+        metrics.db_ms += duration_ms
+
+
+def log_slow_query(sql: str, duration_ms: float, plan: list[str] | None = None, **kwargs) -> None:
+    # Параметры не пишем: в них персональные данные (ФИО, зарплаты)
+    logger.warning("slow_query", sql=sql, duration_ms=round(duration_ms, 1), plan=plan, **kwargs)
+
+
+def _explain(connection, sql: str, params) -> list[str] | None:
+    """
+    План через отдельный курсор драйвера: мимо execute_wrappers и без порчи результата запроса.
+    Внутри atomic - под своим savepoint: упавший EXPLAIN (statement_timeout и т.п.) иначе
+    оставил бы транзакцию запроса в состоянии aborted.
+    """
+    in_transaction = connection.in_atomic_block
+    try:
+        with connection.connection.cursor() as cursor:
+            if in_transaction:
+                cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN {sql}", params)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception:
+                if in_transaction:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            finally:
+                if in_transaction:
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+    except Exception:
+        logger.warning("slow_query_explain_failed", exc_info=True)
+        return None
+
+
+def instrument_query(execute, sql, params, many, context):
+    """execute_wrapper соединений Django (подключается в core.signals при connection_created)"""
+    started = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+    finally:
+        # Упавшие запросы тоже входят в db_queries / db_ms
+        duration_ms = _elapsed_ms(started)
+        record_query(duration_ms)
+
+    if is_slow(duration_ms):
+        connection = context["connection"]
+        plan = None if many or not can_explain(sql) else _explain(connection, sql, params)
+        log_slow_query(sql, duration_ms, plan, alias=connection.alias, many=many)
+    return result
+
+
+def record_cache(hits: int, misses: int, duration_ms: float) -> None:
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+        metrics.cache_ms += duration_ms
+
+
+class InstrumentedRedisClient(DefaultClient):
+    """DefaultClient django-redis, считающий попадания и промахи чтений"""
+
+    def get(self, key, default=None, version=None, client=None):
+        started = time.perf_counter()
+        value = super().get(key, default=_MISSING, version=version, client=client)
+        hit = value is not _MISSING
+        record_cache(int(hit), int(not hit), _elapsed_ms(started))
+        return value if hit else default
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        started = time.perf_counter()
+        values = super().get_many(keys, version=version, client=client)
+        record_cache(len(values), len(keys) - len(values), _elapsed_ms(started))
+        return values
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics = _metrics.get()
+            if metrics is not None:
+                metrics.templates += 1
+                metrics.template_ms += _elapsed_ms(started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates со счетчиком времени рендера. Считаются только шаблоны верхнего
+    уровня (render / render_to_string), {% include %} входит во время родителя.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
+
+
+class RequestMetricsMiddleware:
+    """
+    Собирает метрики запроса и привязывает их к контексту structlog.
+    Должен стоять после django_structlog RequestMiddleware, чтобы успеть до request_finished.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _metrics.set(RequestMetrics())
+        try:
+            return self.get_response(request)
+        finally:
+            self._bind(token)
+
+    async def __acall__(self, request):
+        token = _metrics.set(RequestMetrics())
+        try:
+            return await self.get_response(request)
+        finally:
+            self._bind(token)
+
+    @staticmethod
+    def _bind(token) -> None:
+        metrics = _metrics.get()
+        _metrics.reset(token)
+        structlog.contextvars.bind_contextvars(**metrics.as_log_context())
@@ -0,0 +1,26 @@
+from datetime import date
+from decimal import Decimal
+
+import ujson
+from django.http import HttpResponse
+
+
+def to_json_value(value):
+    """Приводит значения из .values() к типам, которые ujson кодирует без default-хуков"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def dumps(payload) -> str:
+    return ujson.dumps(payload, ensure_ascii=False)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse на ujson: для списков из .values() без шаблонов и DjangoJSONEncoder"""
+
+    def __init__(self, payload, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(payload), **kwargs)